@@ -0,0 +1,116 @@
+"""
+Fetch path benchmark against local stand-in chains
+
+Starts the fake LCDs and Namada indexers of fake_chain.py in a child process,
+points the network registry at them and runs `save_data` for a number of
+cycles, reporting wall time, requests served and peak Python memory of the
+bot in every cycle. Needs no network access and writes to a throwaway
+database.
+
+Usage, from the repository root:
+
+    python benchmarks/bench_fetch.py --chains 30 --proposals 50 --latency 0.1 --hung 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import prepare_config  # noqa: E402
+from fake_chain import FakeChainConfig, FakeChainProcess  # noqa: E402
+
+
+def parse_args():
+    defaults = FakeChainConfig()
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--chains', type=int, default=defaults.chains, help='Cosmos chains')
+    parser.add_argument('--namada-chains', type=int, default=defaults.namada_chains, help='Namada chains')
+    parser.add_argument('--proposals', type=int, default=defaults.proposals, help='proposals in voting per chain')
+    parser.add_argument('--endpoints', type=int, default=defaults.endpoints_per_chain, help='endpoints per chain')
+    parser.add_argument('--latency', type=float, default=defaults.latency, help='mean response latency, seconds')
+    parser.add_argument('--latency-sigma', type=float, default=defaults.latency_sigma,
+                        help='sigma of the lognormal latency distribution')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='share of HTTP 500 answers')
+    parser.add_argument('--hung', type=int, default=defaults.hung_endpoints,
+                        help='chains whose primary endpoint never answers')
+    parser.add_argument('--voted-ratio', type=float, default=defaults.voted_ratio,
+                        help='share of proposals already voted on')
+    parser.add_argument('--message-bytes', type=int, default=defaults.message_bytes,
+                        help='wasm code embedded in every gov v1 proposal')
+    parser.add_argument('--read-timeout', type=float, default=2.0, help='per-request read timeout, seconds')
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    return parser.parse_args()
+
+
+async def run(args):
+    server = FakeChainProcess(FakeChainConfig(
+        chains=args.chains,
+        namada_chains=args.namada_chains,
+        proposals=args.proposals,
+        endpoints_per_chain=args.endpoints,
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        hung_endpoints=args.hung,
+        voted_ratio=args.voted_ratio,
+        message_bytes=args.message_bytes,
+        seed=args.seed
+    ))
+    await server.start()
+
+    import registry
+    import sql
+    from get_data import save_data
+    from http_client import create_session
+
+    networks = server.networks()
+    for network in networks:
+        network['read_timeout'] = args.read_timeout
+    registry.REGISTRY.clear()
+    registry.REGISTRY.update(registry.compile_networks(networks))
+
+    print(f"{len(networks)} networks, {args.proposals} proposals each, "
+          f"{args.latency * 1000:.0f}ms mean latency, {args.error_rate:.0%} errors, {args.hung} hung endpoints, "
+          f"{args.message_bytes} bytes of messages per v1 proposal")
+    print(f"{'cycle':>5} {'wall s':>8} {'requests':>9} {'peak MiB':>9} {'rows':>6}")
+    results = []
+    try:
+        async with create_session() as session:
+            for number in range(1, args.cycles + 1):
+                requests_before = server.requests
+                tracemalloc.start()
+                started = time.perf_counter()
+                await save_data(session)
+                wall = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                rows = len(sql.get_all_rows())
+                results.append((wall, server.requests - requests_before, peak))
+                print(f"{number:>5} {wall:>8.3f} {server.requests - requests_before:>9} "
+                      f"{peak / 2 ** 20:>9.2f} {rows:>6}")
+    finally:
+        await server.stop()
+    # The first cycle also discovers the gov API flavour of every endpoint
+    if len(results) > 1:
+        warm = results[1:]
+        print(f"{'warm':>5} {sum(r[0] for r in warm) / len(warm):>8.3f} "
+              f"{sum(r[1] for r in warm) / len(warm):>9.0f} {max(r[2] for r in warm) / 2 ** 20:>9.2f}")
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_config(os.path.join(directory, 'proposals.db'))
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
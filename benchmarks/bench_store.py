@@ -0,0 +1,178 @@
+"""
+Scale benchmark of the SQLite store and the notifier loop
+
+Seeds `proposals` with synthetic rows at several table sizes, then runs
+`processor` against a stand-in for telegram.Bot until the outbox is drained.
+Networks have no endpoints, so the sweep makes no requests and the cycle is
+all database and notifier work. Reports per cycle the wall time, the time
+spent in sql.py (from the bot_sql_seconds metric), the remaining Python time
+and the Bot API calls made, plus per-call timings of the lookups that scan the
+table. Rows are generated from a fixed seed, so runs are comparable.
+
+Usage, from the repository root:
+
+    python benchmarks/bench_store.py --sizes 100 1000 10000 --due-ratio 0.1
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import prepare_config  # noqa: E402
+from fake_chain import VALIDATOR  # noqa: E402
+
+NETWORKS = 20
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, text: str):
+        self.message_id = message_id
+        self.text = text
+
+
+class FakeBot:
+    """
+    Answers the Bot API calls the outbox makes and counts them
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1_000_000)
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        return FakeMessage(next(self._ids), text)
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.calls += 1
+        return True
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        self.calls += 1
+        return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 5_000, 20_000],
+                        help='rows in the proposals table')
+    parser.add_argument('--due-ratio', type=float, default=0.1, help='share of rows due for a reminder')
+    parser.add_argument('--outdated-ratio', type=float, default=0.05,
+                        help='share of rows voted on, to be cleaned up')
+    parser.add_argument('--lookups', type=int, default=200, help='calls per lookup timing')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def seed_rows(size: int, due_ratio: float, outdated_ratio: float, seed: int):
+    rng = random.Random(seed)
+    now = int(time.time())
+    rows = []
+    for index in range(size):
+        roll = rng.random()
+        option = 1 if roll < outdated_ratio else 0
+        due = outdated_ratio <= roll < outdated_ratio + due_ratio
+        rows.append((
+            f"bench-{index % NETWORKS}",
+            index,
+            f"Proposal {index}",
+            now + rng.randint(3_600, 10 * 86_400),
+            option,
+            now - 60 if due else now + rng.randint(600, 86_400),
+            index + 1,
+            None
+        ))
+    return rows
+
+
+def time_calls(func, args_list):
+    started = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - started) / len(args_list)
+
+
+def sql_seconds(metric) -> float:
+    return sum(child.sum for _, child in metric.children())
+
+
+async def run_size(size, args, directory):
+    import registry
+    import sql
+    from metrics import SQL_SECONDS
+    from notifier import processor
+    from outbox import Outbox
+    from http_client import create_session
+
+    sql.storage.close()
+    sql.storage.path = os.path.join(directory, f"proposals-{size}.db")
+    sql.create_table()
+    voter = next(iter(registry.REGISTRY.values())).voters[0]
+    rows = [row[:7] + (voter,) for row in seed_rows(size, args.due_ratio, args.outdated_ratio, args.seed)]
+    with sql.storage.con:
+        sql.storage.con.executemany(
+            f"INSERT INTO proposals ({sql.ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    rng = random.Random(args.seed)
+    keys = [(row[0], row[1], row[7]) for row in rng.sample(rows, min(args.lookups, len(rows)))]
+    all_rows_ms = time_calls(sql.get_all_rows, [()] * 10) * 1000
+    duplicates_us = time_calls(sql.check_dublicates, keys) * 1e6
+    get_rows_us = time_calls(sql.get_rows, keys) * 1e6
+
+    bot = FakeBot()
+    outbox = Outbox(bot)
+    outbox.start()
+    due = len(sql.get_due_rows(int(time.time())))
+    db_before = sql_seconds(SQL_SECONDS)
+    async with create_session() as session:
+        started = time.perf_counter()
+        await processor(outbox, session)
+        await outbox.join()
+        wall = time.perf_counter() - started
+    await outbox.stop()
+    db = sql_seconds(SQL_SECONDS) - db_before
+    print(f"{size:>7} {due:>6} {wall * 1000:>9.1f} {db * 1000:>8.1f} {(wall - db) * 1000:>10.1f} "
+          f"{bot.calls:>6} {all_rows_ms:>10.2f} {duplicates_us:>10.1f} {get_rows_us:>10.1f}")
+
+
+async def run(args, directory):
+    import registry
+
+    # Known networks without endpoints: reminders can be rendered, sweeps fetch nothing
+    registry.REGISTRY.clear()
+    registry.REGISTRY.update(registry.compile_networks([
+        {"name": f"bench-{index}", "lcd_endpoints": [], "validator": VALIDATOR, "prefix": "osmo",
+         "explorer": "https://example.com/"}
+        for index in range(NETWORKS)
+    ]))
+    print(f"due ratio {args.due_ratio:.0%}, outdated ratio {args.outdated_ratio:.0%}, seed {args.seed}")
+    print(f"{'rows':>7} {'due':>6} {'cycle ms':>9} {'db ms':>8} {'python ms':>10} {'api':>6} "
+          f"{'all rows ms':>10} {'dupl. µs':>10} {'get_rows µs':>10}")
+    for size in args.sizes:
+        await run_size(size, args, directory)
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        config = prepare_config(os.path.join(directory, 'proposals.db'))
+        # Every network logs that it has no endpoints on each sweep
+        logging.getLogger().setLevel(logging.CRITICAL)
+        # Telegram limits would only measure the token buckets
+        config.TELEGRAM_GLOBAL_LIMIT = (10 ** 9, 1)
+        config.TELEGRAM_CHAT_LIMIT = (10 ** 9, 1)
+        asyncio.run(run(args, directory))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""
+Shared setup of the benchmarks
+"""
+
+import importlib
+import logging
+
+
+def prepare_config(sql_path: str):
+    """
+    Load the bot settings before any bot module is imported
+
+    Points the database at `sql_path` so a benchmark never touches the real
+    one. Must run before the bot modules are imported.
+    """
+    # Bot modules call basicConfig on import, configuring logging first keeps them quiet
+    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.ERROR)
+    config = importlib.import_module('settings')
+    config.SQL_PATH = sql_path
+    config.METRICS_PORT = None
+    config.TRACE_DIR = None
+    return config
@@ -0,0 +1,247 @@
+"""
+Local stand-in for Cosmos LCDs and Namada indexers
+
+Every emulated endpoint listens on its own port of 127.0.0.1, so the bot's
+per-host request limits behave as they do against real nodes. Cosmos
+endpoints serve the gov v1beta1 and v1 proposal and vote routes, Namada
+endpoints the indexer proposal and voter routes. Latency, error rate and
+hung endpoints are configurable.
+
+FakeChainProcess runs the server in a child process, so the time and memory
+spent building responses are not counted as the bot's.
+"""
+
+import asyncio
+import base64
+import datetime
+import hashlib
+import multiprocessing
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from aiohttp import web
+
+VALIDATOR = "osmovaloper13tk45jkxgf7w0nxquup3suwaz2tx483xe832ge"
+NAMADA_VALIDATOR = "tnam1qbenchmarkvalidator"
+
+
+@dataclass
+class Chain:
+    name: str
+    provider: str  # 'cosmos' or 'namada'
+    proposals: int
+    ports: List[int] = field(default_factory=list)
+    # Cosmos chains serving only gov v1 answer v1beta1 requests with HTTP 501
+    v1_only: bool = False
+
+
+@dataclass
+class FakeChainConfig:
+    chains: int = 10
+    namada_chains: int = 1
+    proposals: int = 20
+    endpoints_per_chain: int = 2
+    latency: float = 0.05  # seconds, mean of a lognormal distribution
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0  # share of requests answered with HTTP 500
+    hung_endpoints: int = 0  # endpoints, first ones of the first chains, that never answer
+    voted_ratio: float = 0.5  # share of proposals the validator voted on
+    v1_only_ratio: float = 0.3
+    page_size: int = 10
+    message_bytes: int = 0  # wasm code embedded in every gov v1 proposal, as MsgStoreCode does
+    seed: int = 1
+
+
+class FakeChainServer:
+    """
+    Serves every emulated chain and counts the requests it answers
+    """
+
+    def __init__(self, config: FakeChainConfig, base_port: int = 19300):
+        self.config = config
+        self.base_port = base_port
+        self.random = random.Random(config.seed)
+        # Shared memory, so the count can be read from outside a child process
+        self._requests = multiprocessing.Value('L', 0, lock=False)
+        self.chains: List[Chain] = []
+        self._by_port: Dict[int, Chain] = {}
+        self._hung_ports = set()
+        self._runner = None
+        self._end_time = int(time.time()) + 5 * 86_400
+        self._messages = []
+        if config.message_bytes:
+            self._messages = [{
+                "@type": "/cosmwasm.wasm.v1.MsgStoreCode",
+                "sender": "osmo10d07y265gmmuvt4z0w9aw880jnsr700jjeq4qp",
+                "wasm_byte_code": base64.b64encode(random.Random(config.seed).randbytes(config.message_bytes)).decode()
+            }]
+        self._build_chains()
+
+    @property
+    def requests(self) -> int:
+        return self._requests.value
+
+    def _build_chains(self):
+        port = self.base_port
+        for index in range(self.config.chains + self.config.namada_chains):
+            namada = index >= self.config.chains
+            chain = Chain(
+                name=f"{'namada' if namada else 'cosmos'}-{index}",
+                provider='namada' if namada else 'cosmos',
+                proposals=self.config.proposals,
+                v1_only=not namada and self.random.random() < self.config.v1_only_ratio
+            )
+            for _ in range(self.config.endpoints_per_chain):
+                chain.ports.append(port)
+                self._by_port[port] = chain
+                port += 1
+            self.chains.append(chain)
+        # Hang the primary endpoint of the first chains, so fallback is exercised
+        primaries = [chain.ports[0] for chain in self.chains]
+        self._hung_ports = set(primaries[:self.config.hung_endpoints])
+
+    def networks(self) -> List[dict]:
+        """NETWORKS entries pointing the bot at the emulated chains"""
+        networks = []
+        for chain in self.chains:
+            urls = [f"http://127.0.0.1:{port}" for port in chain.ports]
+            if chain.provider == 'namada':
+                networks.append({
+                    "name": chain.name, "provider": "namada", "indexers": urls,
+                    "validator_address": NAMADA_VALIDATOR, "explorer": "https://example.com/"
+                })
+            else:
+                networks.append({
+                    "name": chain.name, "lcd_endpoints": urls, "validator": VALIDATOR, "prefix": "osmo",
+                    "explorer": "https://example.com/"
+                })
+        return networks
+
+    def _voted(self, chain: Chain, prop_id: int) -> bool:
+        digest = hashlib.sha256(f"{chain.name}/{prop_id}".encode()).digest()
+        return digest[0] / 256 < self.config.voted_ratio
+
+    @web.middleware
+    async def _emulate(self, request: web.Request, handler):
+        self._requests.value += 1
+        port = request.transport.get_extra_info('sockname')[1]
+        if port in self._hung_ports:
+            await asyncio.sleep(3600)
+        await asyncio.sleep(self.random.lognormvariate(0, self.config.latency_sigma) * self.config.latency)
+        if self.random.random() < self.config.error_rate:
+            return web.json_response({"code": 13, "message": "internal error"}, status=500)
+        request['chain'] = self._by_port[port]
+        return await handler(request)
+
+    async def _proposals(self, request: web.Request):
+        chain = request['chain']
+        version = request.match_info['version']
+        if chain.v1_only and version == 'v1beta1':
+            return web.json_response({"code": 12, "message": "Not Implemented"}, status=501)
+        limit = int(request.query.get('pagination.limit', 100))
+        start = int(request.query.get('pagination.key') or 0)
+        end = min(chain.proposals, start + min(limit, self.config.page_size))
+        end_time = datetime.datetime.fromtimestamp(self._end_time, datetime.timezone.utc).isoformat()
+        proposals = []
+        for prop_id in range(start + 1, end + 1):
+            if version == 'v1beta1':
+                proposals.append({
+                    "proposal_id": str(prop_id), "content": {"title": f"Proposal {prop_id}"},
+                    "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": end_time
+                })
+            else:
+                proposals.append({
+                    "id": str(prop_id), "title": f"Proposal {prop_id}", "messages": self._messages,
+                    "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": end_time
+                })
+        next_key = str(end) if end < chain.proposals else None
+        return web.json_response({"proposals": proposals, "pagination": {"next_key": next_key, "total": "0"}})
+
+    async def _vote(self, request: web.Request):
+        chain = request['chain']
+        prop_id = int(request.match_info['prop_id'])
+        if self._voted(chain, prop_id):
+            return web.json_response({"vote": {"proposal_id": str(prop_id), "voter": request.match_info['voter']}})
+        return web.json_response({"code": 5, "message": "vote not found"}, status=404)
+
+    async def _namada_proposals(self, request: web.Request):
+        chain = request['chain']
+        page = int(request.query.get('page', 1))
+        size = self.config.page_size
+        total_pages = max(1, -(-chain.proposals // size))
+        results = [
+            {"id": str(prop_id), "content": f"Proposal {prop_id}", "status": "votingPeriod",
+             "endTime": str(self._end_time)}
+            for prop_id in range((page - 1) * size + 1, min(page * size, chain.proposals) + 1)
+        ]
+        return web.json_response({
+            "results": results,
+            "pagination": {"page": page, "perPage": size, "totalPages": total_pages, "totalItems": chain.proposals}
+        })
+
+    async def _namada_votes(self, request: web.Request):
+        chain = request['chain']
+        return web.json_response([
+            {"proposalId": prop_id, "vote": "yay"}
+            for prop_id in range(1, chain.proposals + 1) if self._voted(chain, prop_id)
+        ])
+
+    async def start(self):
+        app = web.Application(middlewares=[self._emulate])
+        app.router.add_get('/{gov_prefix}/gov/{version}/proposals', self._proposals)
+        app.router.add_get('/{gov_prefix}/gov/{version}/proposals/{prop_id}/votes/{voter}', self._vote)
+        app.router.add_get('/api/v1/gov/proposal', self._namada_proposals)
+        app.router.add_get('/api/v1/gov/voter/{voter}/votes', self._namada_votes)
+        self._runner = web.AppRunner(app, handler_cancellation=True)
+        await self._runner.setup()
+        for port in self._by_port:
+            await web.TCPSite(self._runner, '127.0.0.1', port, shutdown_timeout=1).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def _serve(server: FakeChainServer, ready, done):
+    async def serve():
+        await server.start()
+        ready.set()
+        await asyncio.get_running_loop().run_in_executor(None, done.wait)
+        await server.stop()
+
+    asyncio.run(serve())
+
+
+class FakeChainProcess:
+    """
+    FakeChainServer running in a child process, with the same interface
+    """
+
+    def __init__(self, config: FakeChainConfig, base_port: int = 19300):
+        self.server = FakeChainServer(config, base_port)
+        self._ready = multiprocessing.Event()
+        self._done = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.server, self._ready, self._done), daemon=True
+        )
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    def networks(self) -> List[dict]:
+        return self.server.networks()
+
+    async def start(self):
+        self._process.start()
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self._ready.wait, 60):
+            self._process.terminate()
+            raise RuntimeError("fake chains did not start")
+
+    async def stop(self):
+        self._done.set()
+        await asyncio.get_running_loop().run_in_executor(None, self._process.join, 10)
+        if self._process.is_alive():
+            self._process.terminate()
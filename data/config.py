@@ -1,11 +1,66 @@
-NOTIFIER_FREQUENCY = 60 * 15 # seconds
+NOTIFIER_FREQUENCY = 60 * 15 # seconds between chain polls, reminders are sent as soon as they are due
+NOTIFIER_DIGEST = False # one message listing every open proposal instead of a message per proposal
+NOTIFIER_EDIT_IN_PLACE = False # edit a proposal's reminder until its tier escalates instead of sending a new one
+STARTUP_TIME_TARGET = 60 # seconds from process start until every network has been swept once
+INGEST_TIMEOUT = 60 * 5 # seconds a network sweep may take before it is abandoned until the next poll
+INGEST_QUEUE_SIZE = 16 # swept networks waiting to be saved before sweeps wait for the database
+CLEANUP_FREQUENCY = 60 * 5 # seconds between deletions of outdated reminders, also run when voting ends
+
+# Endpoint health scoring, used to order LCD endpoints and Namada indexers
+ENDPOINT_LATENCY_EWMA_ALPHA = 0.3 # weight of the latest request in latency and error rate averages
+CIRCUIT_BREAKER_FAILURES = 3 # consecutive failures before an endpoint is skipped
+CIRCUIT_BREAKER_COOLDOWN = 60 * 10 # seconds to skip a failing endpoint before trying it again
+
+# Hedged requests for networks with several lcd_endpoints, can be set per network with "hedging": True
+HEDGING_ENABLED = False
+HEDGE_PERCENTILE = 95 # hedge once a request is slower than this percentile of the endpoint's latency
+HEDGE_MIN_DELAY = 0.5 # seconds, never hedge sooner than this
+HEDGE_BUDGET_RATIO = 0.1 # at most ~10% extra requests per network, override with "hedge_budget_ratio"
+HEDGE_BUDGET_BURST = 5 # hedges a network may spend at once, override with "hedge_budget_burst"
+
+# Shared HTTP client
+HTTP_CONNECTION_LIMIT = 100 # open connections in total
+HTTP_CONNECTION_LIMIT_PER_HOST = 8 # open connections per host
+HTTP_KEEPALIVE_TIMEOUT = 60 # seconds an idle connection is kept open
+HTTP_DNS_CACHE_TTL = 60 * 10 # seconds
+HTTP_CONNECT_TIMEOUT = 5 # seconds, override per network with "connect_timeout"
+HTTP_READ_TIMEOUT = 15 # seconds, override per network with "read_timeout"
+
+# Request scheduling, vote checks of proposals closest to their end go first
+FETCH_CONCURRENCY = 32 # requests in flight in total
+FETCH_CONCURRENCY_PER_HOST = 4 # requests in flight per host
+RATE_LIMIT_RETRIES = 2 # retries of a request answered with HTTP 429
+RATE_LIMIT_BACKOFF = 30 # seconds to pause a host after HTTP 429 without Retry-After
+RATE_LIMIT_MAX_PAUSE = RATE_LIMIT_BACKOFF * 2 # longest Retry-After waited out, a longer one fails the endpoint
 
 SQL_PATH = './data/proposals.db'
 
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics, None to disable
+METRICS_HOST = '127.0.0.1' # '0.0.0.0' in Docker, or the scraper can't reach it, see docker-compose.yml
+METRICS_PORT = None
+
+# Tracing and profiling, see tracing.py
+TRACE_DIR = None # directory for one JSONL file of spans per cycle, e.g. './data/traces', None to disable
+TRACE_KEEP = 200 # trace files kept, older ones are removed
+PROFILE_DIR = './data/profiles' # cProfile stats of windows started by SIGUSR1, or at startup with BOT_PROFILE=1
+PROFILE_WINDOW = NOTIFIER_FREQUENCY + INGEST_TIMEOUT # seconds profiled after SIGUSR1, every network is swept at least once
+
+PROPOSALS_PAGE_LIMIT = 100 # proposals requested per page, override per network with "page_limit"
+MAX_PROPOSAL_PAGES = 50 # safety stop when following pagination.next_key
+GOV_API_CACHE_TTL = 60 * 60 * 6 # seconds to remember which gov API path and version an endpoint serves
+JSON_BACKEND = 'auto' # 'ijson' streams proposal listings, 'orjson' or 'json' decode whole bodies, 'auto' decodes whole with orjson if installed
+JSON_STREAM_THRESHOLD = 4 * 2**20 # bytes, 'auto' streams larger proposal listings when ijson is installed, None to never stream
+
 TG_BOT_API_TOKEN = 'insert_your_bot_api_token'
 CHAT_ID = 1   # insert chat id, even if tarts with -
 MESSAGE_THREAD_ID = 1 # insert MESSAGE_THREAD id
 
+# Telegram outbox, calls are queued in the database and sent within Bot API limits
+TELEGRAM_GLOBAL_LIMIT = (30, 1) # (calls, seconds) for the whole bot
+TELEGRAM_CHAT_LIMIT = (20, 60) # (messages, seconds) for one group
+OUTBOX_WORKERS = 4 # Telegram calls in flight
+OUTBOX_MAX_ATTEMPTS = 5 # attempts of a failing send before the reminder is skipped
+
 NOTIFIER_REMINDER_MODES = {
         "SOFT": (range(345_600, 3_036_800), 86_400),
         "MEDIUM": (range(172_800, 345_600), 43_200),
@@ -30,7 +85,7 @@ NETWORKS = [
             "http://jupiter.cybernode.ai:36317",
             "https://api.bostrom.alternative.io"  # Will fallback if first fails
         ],
-        "validator": "bostromvaloper1ydc5fy9fjdygvgw36u49yj39fr67pd9m5qexm8",
+        "validator": "bostromvaloper1ydc5fy9fjdygvgw36u49yj39fr67pd9m5qexm8",  # or "validators": [...] for several
         "prefix": "bostrom",
         "explorer": "https://cyb.ai/senate/"
     },
@@ -130,6 +185,7 @@ NETWORKS = [
    #     "name": "namada",
    #     "provider": "namada",  # Required for Namada
    #     "validator_address": "tnam1qqwemkdvpvnqs3djdz23lhu0aeuun59vxje7pqp3",  # Your Namada validator address
+   #     # or "validator_addresses": [...] to track several validators
    #     "indexers": [
    #         "https://indexer.namada.citizenweb3.com",  # Citizen Web3
    #         "https://indexer.namada.net",  # Heliax (official)
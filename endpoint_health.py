@@ -0,0 +1,252 @@
+"""
+Health scoring and circuit breaking for LCD endpoints and Namada indexers
+
+Every request outcome is recorded per endpoint. Fallback loops ask for the
+endpoints ordered by score instead of walking the config order, so a dead or
+slow primary is paid for once and then skipped. `call_endpoints` runs such a
+loop and can optionally hedge a slow request onto the next endpoint.
+
+Latency is measured from the moment the scheduler gave a request its slot,
+so our own queueing never makes an endpoint look slow or triggers a hedge.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from scheduler import RequestClock, request_clock
+from settings import (
+    ENDPOINT_LATENCY_EWMA_ALPHA, CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_COOLDOWN,
+    HEDGE_PERCENTILE, HEDGE_MIN_DELAY
+)
+
+# Seconds added to the score per unit of error rate, so an endpoint failing
+# half of the time ranks below a healthy one that is a few seconds slower
+ERROR_PENALTY_S = 10.0
+
+# Latest successful latencies kept per endpoint for the hedging percentile
+LATENCY_WINDOW = 50
+
+
+class EndpointsExhausted(Exception):
+    """Raised by call_endpoints when no endpoint gave an answer"""
+
+
+class MalformedResponse(Exception):
+    """
+    The endpoint answered but its data could not be used. Not held against the
+    endpoint, and not retried elsewhere since other endpoints serve the same chain.
+    """
+
+
+class EndpointHealth:
+    """
+    Latency and error statistics of a single endpoint
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.latency: Optional[float] = None  # EWMA, seconds
+        self.error_rate = 0.0  # EWMA of failures, 0..1
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def score(self) -> float:
+        """Lower is better. Endpoints never tried yet score as the fastest ones."""
+        return (self.latency or 0.0) + self.error_rate * ERROR_PENALTY_S
+
+    def is_open(self, now: float) -> bool:
+        return now < self.opened_until
+
+    def record(self, latency: float, failed: bool):
+        alpha = ENDPOINT_LATENCY_EWMA_ALPHA
+        self.latency = latency if self.latency is None else alpha * latency + (1 - alpha) * self.latency
+        self.error_rate = alpha * float(failed) + (1 - alpha) * self.error_rate
+        if not failed:
+            self.samples.append(latency)
+
+    def hedge_delay(self) -> float:
+        """
+        Seconds to wait for this endpoint before hedging onto the next one:
+        the HEDGE_PERCENTILE of its recent latencies, never below HEDGE_MIN_DELAY
+        """
+        if not self.samples:
+            return max(HEDGE_MIN_DELAY, self.latency or 0.0)
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(HEDGE_MIN_DELAY, ordered[index])
+
+
+class HealthTracker:
+    """
+    Registry of EndpointHealth objects shared by all fetchers
+    """
+
+    def __init__(self):
+        self._endpoints: Dict[str, EndpointHealth] = {}
+
+    def get(self, endpoint: str) -> EndpointHealth:
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = EndpointHealth(endpoint)
+        return self._endpoints[endpoint]
+
+    def order(self, endpoints: Iterable[str]) -> List[str]:
+        """
+        Order endpoints for a fallback loop
+
+        Endpoints with a closed circuit come first, best score first, with the
+        config order breaking ties. Open circuits are kept at the end as a last
+        resort, the one closest to its retry time first.
+        """
+        now = time.monotonic()
+        stats = [self.get(endpoint) for endpoint in endpoints]
+        closed = sorted((s for s in stats if not s.is_open(now)), key=lambda s: s.score)
+        opened = sorted((s for s in stats if s.is_open(now)), key=lambda s: s.opened_until)
+        return [s.endpoint for s in closed + opened]
+
+    def record_success(self, endpoint: str, latency: float):
+        health = self.get(endpoint)
+        health.record(latency, failed=False)
+        if health.consecutive_failures >= CIRCUIT_BREAKER_FAILURES:
+            logging.info(f"Endpoint {endpoint} recovered, closing circuit")
+        health.consecutive_failures = 0
+        health.opened_until = 0.0
+
+    def record_cancelled(self, endpoint: str, latency: float):
+        """A request lost a hedge race: only its latency so far is known"""
+        health = self.get(endpoint)
+        alpha = ENDPOINT_LATENCY_EWMA_ALPHA
+        if health.latency is None or latency > health.latency:
+            health.latency = latency if health.latency is None else alpha * latency + (1 - alpha) * health.latency
+
+    def record_failure(self, endpoint: str, latency: float):
+        health = self.get(endpoint)
+        health.record(latency, failed=True)
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= CIRCUIT_BREAKER_FAILURES:
+            # Also re-opens a circuit whose trial request after the cooldown failed
+            health.opened_until = time.monotonic() + CIRCUIT_BREAKER_COOLDOWN
+            logging.warning(
+                f"Endpoint {endpoint} failed {health.consecutive_failures} times in a row, "
+                f"skipping it for {CIRCUIT_BREAKER_COOLDOWN}s"
+            )
+
+
+class HedgeBudget:
+    """
+    Token bucket capping hedged requests of one network to a share of its
+    requests: every request adds `ratio` tokens, every hedge spends one
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def on_request(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+health = HealthTracker()
+
+
+async def call_endpoints(
+    endpoints: Iterable[str],
+    attempt: Callable[[str], Awaitable[Any]],
+    hedge_budget: Optional[HedgeBudget] = None
+) -> Any:
+    """
+    Run `attempt(endpoint)` against endpoints, healthiest first, until one succeeds
+
+    Without a hedge budget this is a plain fallback loop. With one, a request
+    that takes longer than its endpoint's hedge delay gets a duplicate sent to
+    the next endpoint while the budget allows it. The first good answer wins
+    and the other request is cancelled.
+
+    Raises:
+        EndpointsExhausted: every endpoint failed
+        MalformedResponse: an endpoint answered with data that could not be used
+    """
+    remaining = iter(health.order(endpoints))
+    pending: Dict[asyncio.Future, tuple] = {}
+    last_error = None
+
+    async def timed(endpoint: str, clock: RequestClock):
+        # Runs in the task's own context, the clock is only seen by this attempt
+        request_clock.set(clock)
+        return await attempt(endpoint)
+
+    def launch() -> bool:
+        endpoint = next(remaining, None)
+        if endpoint is None:
+            return False
+        clock = RequestClock()
+        pending[asyncio.ensure_future(timed(endpoint, clock))] = (endpoint, clock)
+        return True
+
+    if not launch():
+        raise EndpointsExhausted("no endpoints configured")
+    if hedge_budget is not None:
+        hedge_budget.on_request()
+    may_hedge = hedge_budget is not None
+
+    try:
+        while pending:
+            waiting = set(pending)
+            timeout = None
+            if may_hedge and len(pending) == 1:
+                endpoint, clock = next(iter(pending.values()))
+                if clock.started is None:
+                    # Still queued for a slot, start the hedge delay once it is granted
+                    waiting.add(clock.granted)
+                else:
+                    timeout = max(0.0, health.get(endpoint).hedge_delay() - clock.elapsed())
+
+            done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            done = [task for task in done if task in pending]
+
+            if not done:
+                if timeout is None:
+                    # The slot was granted
+                    continue
+                # The request is slower than usual, race it against the next endpoint
+                if hedge_budget.try_spend() and launch():
+                    logging.info(f"Hedging slow request to {endpoint}")
+                else:
+                    may_hedge = False
+                continue
+
+            for task in done:
+                endpoint, clock = pending.pop(task)
+                try:
+                    result = task.result()
+                except MalformedResponse:
+                    health.record_success(endpoint, clock.elapsed())
+                    raise
+                except Exception as e:
+                    last_error = e
+                    health.record_failure(endpoint, clock.elapsed())
+                    continue
+                health.record_success(endpoint, clock.elapsed())
+                return result
+
+            if not pending:
+                launch()
+    finally:
+        for task, (endpoint, clock) in pending.items():
+            task.cancel()
+            # A request still queued for a slot tells nothing about the endpoint
+            if clock.started is not None:
+                health.record_cancelled(endpoint, clock.elapsed())
+
+    raise EndpointsExhausted(f"all endpoints failed, last error: {last_error}")
@@ -1,9 +1,16 @@
-from data.config import NETWORKS
-from sql import save_to_db, create_table, check_dublicates, set_option
-from _wallet import address_to_address
+from registry import REGISTRY
+from endpoint_health import call_endpoints, EndpointsExhausted, MalformedResponse
+from sql import save_proposals, create_table, mark_voted, get_voted
 from dateutil import parser
 from itertools import chain
-from namada_provider import NamadaProvider
+from http_client import create_session
+from scheduler import scheduler
+from gov_api import gov_api
+from namada_provider import IndexerUnavailable
+from settings import MAX_PROPOSAL_PAGES
+from metrics import track_fetch
+from tracing import span
+from proposal_decoder import read_proposals_page, read_json
 
 import aiohttp
 import asyncio
@@ -14,91 +21,122 @@ import logging
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
 
-async def get_proposals(session, network):
+async def iter_proposals(session, network):
+    """
+    Yield parsed voting period proposals of a network page by page
+    """
     # Check if network is Namada
-    if network.get('provider') == 'namada':
-        return await get_namada_proposals(session, network)
-    
-    # Get the gov module prefix (e.g., 'atomone' for AtomOne, default 'cosmos')
-    gov_prefix = network.get('gov_prefix', 'cosmos')
-    
-    # Support both single lcd_api and multiple lcd_endpoints
-    endpoints = network.get('lcd_endpoints', [network.get('lcd_api')]) if network.get('lcd_api') else network.get('lcd_endpoints', [])
+    if network.is_namada:
+        async for page in iter_namada_proposals(session, network):
+            yield page
+        return
     
-    if not endpoints:
-        logging.error(f"No LCD endpoints configured for {network['name']}")
-        return []
+    if not network.endpoints:
+        logging.error(f"No LCD endpoints configured for {network.name}")
+        return
     
-    last_error = None
-    
-    # Try each endpoint until one succeeds
-    for endpoint in endpoints:
-        # Try v1beta1 first (works for most chains including AtomOne)
+    next_key = None
+    for _ in range(MAX_PROPOSAL_PAGES):
+        # Try each endpoint until one succeeds, healthiest first
         try:
-            url = f"{endpoint}/{gov_prefix}/gov/v1beta1/proposals?proposal_status=2&pagination.limit=100"
-            print(url)
-            async with session.get(url) as resp:
-                resp_json = await resp.json()
-                props = [prop for prop in resp_json.get('proposals', []) if prop['status'] == 'PROPOSAL_STATUS_VOTING_PERIOD']
-                return [parse_proposal(network, prop, api_version='v1beta1') for prop in props]
-        except Exception as e:
-            last_error = e
-            logging.warning(f"v1beta1 API failed for {network['name']} on {endpoint}: {e}")
-        
-        # Fallback to v1 if v1beta1 fails for this endpoint
+            page, new_key = await call_endpoints(
+                network.endpoints,
+                lambda endpoint: fetch_proposals_page(session, network, endpoint, next_key),
+                network.hedge_budget
+            )
+        except EndpointsExhausted as e:
+            logging.error(f"All endpoints failed for {network.name}. {e}")
+            return
+        except MalformedResponse as e:
+            logging.error(f"Could not parse proposals of {network.name}: {e}")
+            return
+        yield page
+        # An LCD repeating the key it was given would loop forever
+        if not new_key or new_key == next_key:
+            return
+        next_key = new_key
+    logging.warning(f"Stopped paginating {network.name} proposals after {MAX_PROPOSAL_PAGES} pages")
+
+
+async def fetch_proposals_page(session, network, endpoint, next_key=None):
+    """
+    Get one page of voting period proposals from a single endpoint, raise if it can't answer
+
+    The gov API flavour cached for the endpoint is used first. Other ones are
+    only probed when the endpoint answers but rejects it, a connection error
+    or timeout fails the endpoint right away.
+
+    Returns:
+        Parsed proposals of the page and the pagination key of the next page
+    """
+    last_error = None
+    for gov_prefix, api_version in gov_api.candidates(network, endpoint):
         try:
-            url = f"{endpoint}/{gov_prefix}/gov/v1/proposals?proposal_status=2&pagination.limit=100"
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    resp_json = await resp.json()
-                    props = [prop for prop in resp_json.get('proposals', []) if prop['status'] == 'PROPOSAL_STATUS_VOTING_PERIOD']
-                    return [parse_proposal(network, prop, api_version='v1') for prop in props]
+            url = network.proposals_url(endpoint, api_version, next_key, gov_prefix)
+            with track_fetch(network.name, endpoint, 'proposals'):
+                async with scheduler.get(session, url, timeout=network.timeout) as resp:
+                    resp.raise_for_status()
+                    resp_json = await read_proposals_page(resp)
+                if 'proposals' not in resp_json:
+                    raise ValueError(f"no proposals in response: {resp_json}")
+            try:
+                page = parse_proposals_page(network, resp_json, api_version)
+            except Exception as e:
+                raise MalformedResponse(f"{type(e).__name__}: {e}") from e
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            logging.warning(f"Proposals request failed for {network.name} on {endpoint}: {e}")
+            raise
+        except MalformedResponse:
+            # The endpoint serves this flavour, the chain's data is the problem
+            gov_api.remember(network, endpoint, gov_prefix, api_version)
+            raise
         except Exception as e:
             last_error = e
-            logging.warning(f"v1 API failed for {network['name']} on {endpoint}: {e}")
-    
-    # All endpoints failed
-    logging.error(f"All endpoints failed for {network['name']}. Last error: {last_error}")
-    return []
+            gov_api.forget(network, endpoint)
+            logging.warning(f"{gov_prefix} gov {api_version} API failed for {network.name} on {endpoint}: {e}")
+            continue
+        gov_api.remember(network, endpoint, gov_prefix, api_version)
+        return page
+    raise last_error
 
 
-async def get_namada_proposals(session, network):
+def parse_proposals_page(network, resp_json: dict, api_version):
+    props = [prop for prop in resp_json.get('proposals', []) if prop['status'] == 'PROPOSAL_STATUS_VOTING_PERIOD']
+    next_key = (resp_json.get('pagination') or {}).get('next_key')
+    return [parse_proposal(network, prop, api_version=api_version) for prop in props], next_key
+
+
+async def iter_namada_proposals(session, network):
     """
-    Get proposals for Namada via custom provider
+    Yield proposals of Namada via custom provider page by page
     """
     try:
-        provider = NamadaProvider(network)
-        proposals = await provider.get_proposals_with_votes(session)
-        
-        # Convert to format expected by the rest of the code
-        # proposals are in format [network, id, title, end_time, voted]
-        result = []
-        for prop in proposals:
-            # prop = [network, id, title, end_time, voted]
-            # We need format [network, id, title, end_time]
+        async for proposals in network.namada.iter_voting_period_proposals(session):
+            # Convert to format expected by the rest of the code
             # Vote status will be checked later in get_vote
-            result.append(prop[:4])  # Take first 4 elements
-        
-        return result
+            yield [
+                [proposal['network'], proposal['id'], proposal['title'], proposal['voting_end_time']]
+                for proposal in proposals
+            ]
+    except IndexerUnavailable as e:
+        logging.error(str(e))
     except Exception as e:
-        logging.error(f"Error getting Namada proposals for {network['name']}: {e}")
-        return []
+        logging.error(f"Error getting Namada proposals for {network.name}: {e}")
 
 
-async def get_vote(session, proposal):
-    network = [network for network in NETWORKS if network['name'] == proposal[0]][0]
+async def get_vote(session, proposal, voter):
+    network = REGISTRY[proposal[0]]
     
     # For Namada use separate vote checking logic
-    if network.get('provider') == 'namada':
+    if network.is_namada:
         try:
-            provider = NamadaProvider(network)
-            has_voted = await provider.check_validator_voted(session, proposal[1])
+            has_voted = await network.namada.check_validator_voted(session, proposal[1], voter)
             
             if not has_voted:
                 proposal.append(False)
                 return proposal
             else:
-                set_option(network['name'], proposal[1], True)
+                mark_voted(network.name, proposal[1], voter, proposal[3])
                 return None
         except Exception as e:
             logging.error(f"Error checking Namada vote for proposal {proposal[1]}: {e}")
@@ -106,61 +144,105 @@ async def get_vote(session, proposal):
             return proposal
     
     # Standard logic for Cosmos SDK networks
-    voter = address_to_address(network['validator'], network['prefix'])
-    
-    # Get the gov module prefix (e.g., 'atomone' for AtomOne, default 'cosmos')
-    gov_prefix = network.get('gov_prefix', 'cosmos')
-    
-    # Support both single lcd_api and multiple lcd_endpoints
-    endpoints = network.get('lcd_endpoints', [network.get('lcd_api')]) if network.get('lcd_api') else network.get('lcd_endpoints', [])
+    # Try each endpoint until one succeeds, healthiest first
+    try:
+        has_voted = await call_endpoints(
+            network.endpoints,
+            lambda endpoint: fetch_vote(session, network, endpoint, proposal[1], voter, priority=proposal[3]),
+            network.hedge_budget
+        )
+    except EndpointsExhausted as e:
+        # If all endpoints failed, assume not voted
+        logging.warning(f"Vote check failed for {network.name} proposal {proposal[1]}: {e}")
+        has_voted = False
     
-    # Try each endpoint until one succeeds
-    for endpoint in endpoints:
+    if not has_voted:
+        proposal.append(False)
+        return proposal
+    mark_voted(network.name, proposal[1], voter, proposal[3])
+    return None
+
+
+async def fetch_vote(session, network, endpoint, prop_id, voter, priority=0):
+    """
+    Check on a single endpoint whether the voter voted, raise if it can't answer
+    """
+    try:
+        gov_prefix, api_version = gov_api.preferred(network, endpoint)
+        url = network.vote_url(endpoint, prop_id, voter, api_version, gov_prefix)
+        with track_fetch(network.name, endpoint, 'vote'):
+            async with scheduler.get(session, url, priority, timeout=network.timeout) as resp:
+                # A vote that does not exist is answered with a 4xx and a JSON `code`,
+                # server errors and rate limits mean the endpoint could not tell
+                if resp.status == 429 or resp.status >= 500:
+                    resp.raise_for_status()
+                resp_json = await read_json(resp)
+        return 'code' not in list(resp_json.keys())
+    except Exception as e:
+        logging.warning(f"Vote check failed on {endpoint}: {e}")
+        raise
+
+
+async def get_votes(session, checks):
+    """
+    Check votes of (proposal, voter) pairs
+
+    Returns:
+        Rows ready to be saved for every pair that has not voted yet
+    """
+    # The scheduler serves the most urgent proposals first, queue them in that order too
+    checks = sorted(checks, key=lambda check: check[0][3])
+    tasks = []
+    for p, voter in checks:
+        tasks.append(asyncio.ensure_future(get_vote(session, list(p), voter)))
+    with span('get_votes'):
+        proposals = await asyncio.gather(*tasks)
+    return [
+        p + [int(time.time()) + 15, 0, voter]
+        for p, (_, voter) in zip(proposals, checks) if p
+    ]
+
+
+async def sweep_network(session, network, voted):
+    """
+    Stream a network's proposals into vote checks as pages arrive
+
+    The proposal list is fetched once and fanned out to every voter of the
+    network. Pairs in `voted` are already known to be voted on and are skipped.
+    """
+    with span('sweep_network', network.name):
+        tasks = []
         try:
-            url = f"{endpoint}/{gov_prefix}/gov/v1beta1/proposals/{proposal[1]}/votes/{voter}"
-            async with session.get(url) as resp:
-                resp_json = await resp.json()
-                print(resp_json)
-                if 'code' in list(resp_json.keys()):
-                    proposal.append(False)
-                    return proposal
-                else:
-                    set_option(network['name'], proposal[1], True)
-                    return None
-        except Exception as e:
-            logging.warning(f"Vote check failed on {endpoint}: {e}")
-            continue
-    
-    # If all endpoints failed, assume not voted
-    proposal.append(False)
-    return proposal
+            async for page in iter_proposals(session, network):
+                checks = [(p, voter) for p in page for voter in network.voters if (p[0], p[1], voter) not in voted]
+                tasks.append(asyncio.ensure_future(get_votes(session, checks)))
+            pages = await asyncio.gather(*tasks)
+        finally:
+            # An abandoned sweep must not keep checking votes in the background
+            for task in tasks:
+                task.cancel()
+    return list(chain.from_iterable(pages))
 
 
-async def get_votes(session, proposals):
+async def get_data(session):
+    voted = get_voted(int(time.time()))
     tasks = []
-    for p in proposals:
-        tasks.append(asyncio.ensure_future(get_vote(session, p)))
+    for network in REGISTRY.values():
+        if network.is_namada:
+            network.namada.reset_votes()
+        tasks.append(asyncio.ensure_future(sweep_network(session, network, voted)))
     proposals = await asyncio.gather(*tasks)
-    return proposals
+    save_proposals(chain.from_iterable(proposals))
+    logging.info("Data saved in a database")
 
 
-async def get_data():
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for network in NETWORKS:
-            tasks.append(asyncio.ensure_future(get_proposals(session, network)))
-        proposals = await asyncio.gather(*tasks)
-        proposals = list(chain.from_iterable(proposals))
-        proposals = [p for p in proposals if p and p != []]
-        proposals = await get_votes(session, proposals)
-        for p in proposals:
-            if p:
-                p.extend([int(time.time()) + 15, 0])
-            else:
-                continue
-        [save_to_db(p) for p in proposals if p and not check_dublicates(p[0], p[1])]
-        # print([(p) for p in proposals if p and not check_dublicates(p[0], p[1])])
-        logging.info("Data saved in a database")
+async def ingest_network(session, network):
+    """
+    Sweep a single network on its own, the rows are returned instead of saved
+    """
+    if network.is_namada:
+        network.namada.reset_votes()
+    return await sweep_network(session, network, get_voted(int(time.time())))
 
 
 def parse_proposal(network, proposal: dict, api_version='v1beta1'):
@@ -170,7 +252,7 @@ def parse_proposal(network, proposal: dict, api_version='v1beta1'):
     v1beta1: uses content.title
     v1: uses title directly (or metadata, or messages[0])
     """
-    network_name = network['name']
+    network_name = network.name
     
     # Parse ID
     if 'id' in proposal.keys():
@@ -186,18 +268,18 @@ def parse_proposal(network, proposal: dict, api_version='v1beta1'):
         # Try direct title first
         title = proposal.get('title')
         
-        # If no title, try metadata
-        if not title and 'metadata' in proposal:
-            title = proposal.get('metadata', {}).get('title')
+        # If no title, try metadata, gov v1 usually has it as a plain string (an URI)
+        if not title and isinstance(proposal.get('metadata'), dict):
+            title = proposal['metadata'].get('title')
         
         # If no metadata, try summary (sometimes used as description)
         if not title:
-            title = proposal.get('summary', '')[:100]  # Limit length
+            title = (proposal.get('summary') or '')[:100]  # Limit length
         
         # If nothing found, try messages (legacy content may be in messages)
-        if not title and 'messages' in proposal and len(proposal['messages']) > 0:
+        if not title and proposal.get('messages'):
             first_msg = proposal['messages'][0]
-            if 'content' in first_msg:
+            if isinstance(first_msg.get('content'), dict):
                 title = first_msg['content'].get('title', '')
     else:
         # For v1beta1 API (legacy networks and AtomOne)
@@ -205,7 +287,7 @@ def parse_proposal(network, proposal: dict, api_version='v1beta1'):
             title = proposal['content']['title']
         except (KeyError, TypeError):
             # Fallback: try to extract from content type (for system proposals like MsgUpdateParams)
-            if 'content' in proposal and '@type' in proposal['content']:
+            if isinstance(proposal.get('content'), dict) and '@type' in proposal['content']:
                 msg_type = proposal['content']['@type']
                 # Extract readable name from type (e.g., /atomone.gov.v1.MsgUpdateParams -> Update Gov Params)
                 if '.' in msg_type:
@@ -228,10 +310,19 @@ def parse_proposal(network, proposal: dict, api_version='v1beta1'):
     return [network_name, _id, title, voting_end_time]
 
 
-async def save_data():
+async def save_data(session=None):
+    """
+    Run one sweep, with the caller's long-lived session if it has one
+    """
     create_table()
-    await get_data()
+    with span('save_data'):
+        if session is None:
+            async with create_session() as session:
+                await get_data(session)
+        else:
+            await get_data(session)
 
 
-asyncio.run(save_data())
+if __name__ == "__main__":
+    asyncio.run(save_data())
 
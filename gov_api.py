@@ -0,0 +1,59 @@
+"""
+Per-endpoint cache of the gov API flavour an LCD speaks
+
+Chains differ in the gov module path (`/cosmos/gov/` or e.g. `/atomone/gov/`)
+and in the API version (v1beta1 or v1). The combination that works is found
+once per endpoint and remembered for GOV_API_CACHE_TTL seconds, so v1-only
+chains do not pay a failed v1beta1 request on every sweep.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from settings import GOV_API_CACHE_TTL
+
+API_VERSIONS = ('v1beta1', 'v1')
+
+
+class GovApiCache:
+    """
+    Remembers the working (gov_prefix, api_version) of every network endpoint
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str], Tuple[str, str, float]] = {}
+
+    def get(self, network, endpoint: str) -> Optional[Tuple[str, str]]:
+        entry = self._entries.get((network.name, endpoint))
+        if entry is None or entry[2] < time.monotonic():
+            return None
+        return entry[0], entry[1]
+
+    def remember(self, network, endpoint: str, gov_prefix: str, api_version: str):
+        self._entries[(network.name, endpoint)] = (gov_prefix, api_version, time.monotonic() + self.ttl)
+
+    def forget(self, network, endpoint: str):
+        self._entries.pop((network.name, endpoint), None)
+
+    def preferred(self, network, endpoint: str) -> Tuple[str, str]:
+        """The cached combination, or the best guess from the config"""
+        return self.get(network, endpoint) or self.candidates(network, endpoint)[0]
+
+    def candidates(self, network, endpoint: str) -> List[Tuple[str, str]]:
+        """
+        Combinations to probe in order: the cached one, then the configured
+        gov_prefix before the default one and the configured gov_version first
+        """
+        prefixes = list(dict.fromkeys([network.gov_prefix, 'cosmos']))
+        versions = [version for version in dict.fromkeys([network.gov_version, *API_VERSIONS]) if version]
+        combinations = [(prefix, version) for prefix in prefixes for version in versions]
+        cached = self.get(network, endpoint)
+        if cached:
+            if cached in combinations:
+                combinations.remove(cached)
+            combinations.insert(0, cached)
+        return combinations
+
+
+gov_api = GovApiCache(GOV_API_CACHE_TTL)
@@ -0,0 +1,42 @@
+"""
+Application-wide HTTP client
+
+The notifier main loop owns one session created here and passes it to every
+processor cycle, so steady-state cycles reuse warm keep-alive connections and
+cached DNS answers instead of reconnecting to every LCD.
+"""
+
+from typing import Any, Dict
+
+import aiohttp
+
+from settings import (
+    HTTP_CONNECTION_LIMIT, HTTP_CONNECTION_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT, HTTP_DNS_CACHE_TTL,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+)
+
+
+def network_timeout(network: Dict[str, Any]) -> aiohttp.ClientTimeout:
+    """
+    Request timeout for a network, "connect_timeout" and "read_timeout"
+    in its config override the global defaults
+    """
+    return aiohttp.ClientTimeout(
+        total=None,
+        sock_connect=network.get('connect_timeout', HTTP_CONNECT_TIMEOUT),
+        sock_read=network.get('read_timeout', HTTP_READ_TIMEOUT)
+    )
+
+
+def create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTION_LIMIT,
+        limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=network_timeout({})
+    )
@@ -0,0 +1,206 @@
+"""
+Prometheus metrics of the fetch, database and Telegram hot paths
+
+Metrics are always collected, they are only served when METRICS_PORT is set:
+`start_server` exposes them in the Prometheus text format on
+http://METRICS_HOST:METRICS_PORT/metrics. No client library is needed, the few
+metric types the bot uses are implemented here.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from settings import METRICS_HOST, METRICS_PORT
+from tracing import span
+
+logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+
+# Seconds, suits both a local SQLite query and a slow LCD
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRICS: List['Metric'] = []
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: Dict[Tuple[str, ...], object] = {}
+        METRICS.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if values not in self._children:
+            self._children[values] = self._new_child()
+        return self._children[values]
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """Label values and value of every child, to read metrics in-process"""
+        return sorted(self._children.items())
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, values: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in self.children():
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class Value:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from `function` whenever metrics are scraped"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return Value()
+
+    def _samples(self, values, child):
+        return [f"{self.name}{format_labels(self.labelnames, values)} {child.get()}"]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+
+class HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return HistogramValue(self.buckets)
+
+    def _samples(self, values, child):
+        names = self.labelnames + ('le',)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{format_labels(names, values + (bound,))} {cumulative}")
+        lines.append(f"{self.name}_bucket{format_labels(names, values + ('+Inf',))} {child.count}")
+        lines.append(f"{self.name}_sum{format_labels(self.labelnames, values)} {child.sum}")
+        lines.append(f"{self.name}_count{format_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+FETCH_SECONDS = Histogram(
+    'bot_fetch_seconds', 'LCD and indexer request latency', ('network', 'endpoint', 'operation')
+)
+FETCH_ERRORS = Counter(
+    'bot_fetch_errors_total', 'Failed LCD and indexer requests', ('network', 'endpoint', 'operation')
+)
+STAGE_SECONDS = Histogram('bot_stage_seconds', 'Duration of a cycle or stage run', ('stage', 'network'))
+REMINDERS_DUE = Counter('bot_reminders_due_total', 'Reminders found due')
+REMINDERS_SENT = Counter('bot_reminders_sent_total', 'Reminders delivered to Telegram', ('kind',))
+OUTBOX_DEPTH = Gauge('bot_outbox_depth', 'Telegram calls queued or in flight')
+SQL_SECONDS = Histogram('bot_sql_seconds', 'SQLite operation duration', ('operation',))
+TELEGRAM_SECONDS = Histogram('bot_telegram_seconds', 'Bot API call latency', ('method',))
+TELEGRAM_ERRORS = Counter('bot_telegram_errors_total', 'Failed Bot API calls', ('method',))
+TELEGRAM_RETRY_AFTER = Counter('bot_telegram_retry_after_total', 'Bot API calls answered with RetryAfter')
+
+
+@contextmanager
+def timer(histogram: Histogram, *labels):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.monotonic() - started)
+
+
+@contextmanager
+def track_fetch(network: str, endpoint: str, operation: str):
+    """
+    Latency and errors of one request, a request cancelled by hedging counts
+    as neither. The request is also a span of the cycle being traced.
+    """
+    started = time.monotonic()
+    try:
+        with span(operation, network, endpoint):
+            yield
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        FETCH_ERRORS.labels(network, endpoint, operation).inc()
+        FETCH_SECONDS.labels(network, endpoint, operation).observe(time.monotonic() - started)
+        raise
+    FETCH_SECONDS.labels(network, endpoint, operation).observe(time.monotonic() - started)
+
+
+def render() -> str:
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_server():
+    """Serve /metrics if METRICS_PORT is set, returns the runner to clean up or None"""
+    if not METRICS_PORT:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    logging.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
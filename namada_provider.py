@@ -4,13 +4,25 @@ Namada Provider для получения информации о пропоуз
 """
 
 import aiohttp
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, Set
 from dateutil import parser
 
+from endpoint_health import call_endpoints, EndpointsExhausted
+from http_client import network_timeout
+from scheduler import scheduler
+from metrics import track_fetch
+from proposal_decoder import read_json
+from settings import MAX_PROPOSAL_PAGES
+
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
 
+class IndexerUnavailable(Exception):
+    """None of the configured Namada indexers could answer"""
+
+
 class NamadaProvider:
     """
     Провайдер для работы с Namada blockchain через HTTP API индексера.
@@ -26,66 +38,106 @@ class NamadaProvider:
                 - name: Имя сети
                 - indexers: Список URL индексеров Namada
                 - validator_address: Адрес валидатора в формате tnam...
+                - validator_addresses: Список адресов, если валидаторов несколько
                 - explorer: URL эксплорера для формирования ссылок
         """
         self.network_name = network['name']
         self.indexers = network.get('indexers', [])
-        self.validator_address = network.get('validator_address', '')
+        self.validator_addresses = network.get('validator_addresses') or [network.get('validator_address', '')]
+        self.validator_address = self.validator_addresses[0]
         self.explorer = network.get('explorer', '')
+        self.timeout = network_timeout(network)
+        self._voted_ids: Dict[str, asyncio.Future] = {}
 
         if not self.indexers:
             raise ValueError(f"Namada network {self.network_name} requires 'indexers' list")
-        if not self.validator_address:
+        if not all(self.validator_addresses):
             raise ValueError(f"Namada network {self.network_name} requires 'validator_address'")
 
-    async def get_voting_period_proposals(self, session: aiohttp.ClientSession) -> List[Dict[str, Any]]:
+    async def iter_voting_period_proposals(
+        self,
+        session: aiohttp.ClientSession
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield voting period proposals page by page, following the indexer pagination
+
+        The first page tells how many pages there are, the rest are requested
+        concurrently and yielded as they arrive.
+
+        Raises:
+            IndexerUnavailable: no indexer could answer
+        """
+        proposals, total_pages = await self._get_voting_period_page(session, 1)
+        if proposals:
+            yield proposals
+        if total_pages > MAX_PROPOSAL_PAGES:
+            logging.warning(f"Stopped paginating {self.network_name} proposals after {MAX_PROPOSAL_PAGES} pages")
+        tasks = [
+            asyncio.ensure_future(self._get_voting_period_page(session, page))
+            for page in range(2, min(total_pages, MAX_PROPOSAL_PAGES) + 1)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                proposals, _ = await task
+                if proposals:
+                    yield proposals
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _get_voting_period_page(
+        self,
+        session: aiohttp.ClientSession,
+        page: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
         """
-        Получить список пропоузалов в стадии голосования
+        Get one page of voting period proposals, trying indexers healthiest first
         
         Returns:
-            Список пропоузалов в унифицированном формате
+            Proposals of the page in unified format (empty if there are none)
+            and the total number of pages
+
+        Raises:
+            IndexerUnavailable: no indexer could answer
         """
-        last_error = None
+        try:
+            return await call_endpoints(self.indexers, lambda indexer_url: self._fetch_page(session, indexer_url, page))
+        except EndpointsExhausted as e:
+            raise IndexerUnavailable(f"All indexers failed for {self.network_name}. {e}") from e
+
+    async def _fetch_page(
+        self,
+        session: aiohttp.ClientSession,
+        indexer_url: str,
+        page: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        url = f"{indexer_url}/api/v1/gov/proposal?status=votingPeriod&page={page}"
+        logging.info(f"Querying Namada indexer: {url}")
+        
+        try:
+            with track_fetch(self.network_name, indexer_url, 'namada_proposals'):
+                async with scheduler.get(session, url, timeout=self.timeout) as resp:
+                    resp.raise_for_status()
+                    data = await read_json(resp)
+        except Exception as e:
+            logging.warning(f"Failed to query indexer {indexer_url}: {e}")
+            raise
+
+        proposals = []
         
-        # Try each indexer in sequence
-        for indexer_url in self.indexers:
+        # Process each proposal from response
+        for namada_proposal in data.get('results', []):
             try:
-                url = f"{indexer_url}/api/v1/gov/proposal?status=votingPeriod"
-                logging.info(f"Querying Namada indexer: {url}")
-                
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status != 200:
-                        last_error = f"HTTP {resp.status}"
-                        continue
-                    
-                    data = await resp.json()
-                    proposals = []
-                    
-                    # Process each proposal from response
-                    for namada_proposal in data.get('results', []):
-                        try:
-                            proposal = self._convert_namada_proposal(namada_proposal)
-                            if proposal:
-                                proposals.append(proposal)
-                        except Exception as e:
-                            logging.warning(f"Failed to convert proposal {namada_proposal.get('id')}: {e}")
-                            continue
-                    
-                    if proposals:
-                        logging.info(f"Found {len(proposals)} voting period proposals from {indexer_url}")
-                        return proposals
-                        
-            except aiohttp.ClientError as e:
-                last_error = str(e)
-                logging.warning(f"Failed to query indexer {indexer_url}: {e}")
-                continue
+                proposal = self._convert_namada_proposal(namada_proposal)
+                if proposal:
+                    proposals.append(proposal)
             except Exception as e:
-                last_error = str(e)
-                logging.error(f"Unexpected error with indexer {indexer_url}: {e}")
+                logging.warning(f"Failed to convert proposal {namada_proposal.get('id')}: {e}")
                 continue
         
-        logging.error(f"All indexers failed for {self.network_name}. Last error: {last_error}")
-        return []
+        logging.info(f"Found {len(proposals)} voting period proposals on page {page} from {indexer_url}")
+        total_pages = int((data.get('pagination') or {}).get('totalPages') or 1)
+        return proposals, total_pages
 
     def _convert_namada_proposal(self, namada_proposal: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
@@ -120,10 +172,72 @@ class NamadaProvider:
             logging.error(f"Error converting Namada proposal: {e}")
             return None
 
+    def reset_votes(self):
+        """
+        Forget the vote sets fetched in the previous cycle
+        """
+        self._voted_ids = {}
+
+    async def get_voted_proposal_ids(self, session: aiohttp.ClientSession, voter: Optional[str] = None) -> Set[int]:
+        """
+        IDs of all proposals the validator voted on
+
+        The vote history is downloaded once per cycle (until `reset_votes`),
+        concurrent callers share the same request. If no indexer can answer,
+        that is logged once and the voter counts as not voted for the cycle.
+
+        Args:
+            session: aiohttp session
+            voter: Validator address, the first configured one by default
+        """
+        voter = voter or self.validator_address
+        if voter not in self._voted_ids:
+            self._voted_ids[voter] = asyncio.ensure_future(self._fetch_voted_proposal_ids(session, voter))
+        return await asyncio.shield(self._voted_ids[voter])
+
+    async def _fetch_voted_proposal_ids(self, session: aiohttp.ClientSession, voter: str) -> Set[int]:
+        try:
+            votes = await call_endpoints(
+                self.indexers,
+                lambda indexer_url: self._fetch_votes(session, indexer_url, voter)
+            )
+        except EndpointsExhausted as e:
+            logging.error(f"Could not fetch votes of {voter} on {self.network_name}, treating as not voted. {e}")
+            return set()
+
+        voted_ids = set()
+        for vote in votes:
+            vote_proposal_id = vote.get('proposalId')
+            
+            # Handle as float (from JSON) and as string
+            if vote_proposal_id is not None:
+                try:
+                    voted_ids.add(int(float(vote_proposal_id)))
+                except (ValueError, TypeError):
+                    continue
+        return voted_ids
+
+    async def _fetch_votes(
+        self,
+        session: aiohttp.ClientSession,
+        indexer_url: str,
+        voter: str
+    ) -> List[Dict[str, Any]]:
+        url = f"{indexer_url}/api/v1/gov/voter/{voter}/votes"
+        try:
+            with track_fetch(self.network_name, indexer_url, 'namada_votes'):
+                async with scheduler.get(session, url, timeout=self.timeout) as resp:
+                    resp.raise_for_status()
+                    return await read_json(resp)
+        except Exception as e:
+            logging.warning(f"Error checking vote on {indexer_url}: {e}")
+            raise
+
     async def check_validator_voted(
         self, 
         session: aiohttp.ClientSession, 
-        proposal_id: int
+        proposal_id: int,
+        voter: Optional[str] = None
     ) -> bool:
         """
         Проверить, проголосовал ли валидатор за данный пропоузал
@@ -131,70 +245,13 @@ class NamadaProvider:
         Args:
             session: aiohttp session
             proposal_id: Proposal ID
+            voter: Validator address, the first configured one by default
             
         Returns:
             True if validator has voted, False otherwise
         """
-        # Try each indexer
-        for indexer_url in self.indexers:
-            try:
-                url = f"{indexer_url}/api/v1/gov/voter/{self.validator_address}/votes"
-                
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status != 200:
-                        continue
-                    
-                    votes = await resp.json()
-                    
-                    # Check if there's a vote for this proposal
-                    for vote in votes:
-                        vote_proposal_id = vote.get('proposalId')
-                        
-                        # Handle as float (from JSON) and as string
-                        if vote_proposal_id is not None:
-                            try:
-                                if int(float(vote_proposal_id)) == proposal_id:
-                                    logging.info(
-                                        f"Validator {self.validator_address} has voted on proposal {proposal_id}"
-                                    )
-                                    return True
-                            except (ValueError, TypeError):
-                                continue
-                    
-                    # If we got here - no vote found
-                    return False
-                    
-            except Exception as e:
-                logging.warning(f"Error checking vote on {indexer_url}: {e}")
-                continue
-        
-        # If all indexers failed, assume not voted
-        logging.warning(f"Could not verify vote status for proposal {proposal_id}")
-        return False
-
-    async def get_proposals_with_votes(
-        self, 
-        session: aiohttp.ClientSession
-    ) -> List[List[Any]]:
-        """
-        Get proposals and check validator voting status
-        
-        Returns:
-            List in format [network_name, proposal_id, title, voting_end_time, voted]
-        """
-        proposals = await self.get_voting_period_proposals(session)
-        result = []
-        
-        for proposal in proposals:
-            has_voted = await self.check_validator_voted(session, proposal['id'])
-            
-            # Form result in format compatible with main code
-            result.append([
-                proposal['network'],
-                proposal['id'],
-                proposal['title'],
-                proposal['voting_end_time'],
-                has_voted  # True if voted
-            ])
-        
-        return result
+        voter = voter or self.validator_address
+        has_voted = proposal_id in await self.get_voted_proposal_ids(session, voter)
+        if has_voted:
+            logging.info(f"Validator {voter} has voted on proposal {proposal_id}")
+        return has_voted
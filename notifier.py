@@ -1,7 +1,18 @@
-from data.my_config import NOTIFIER_FREQUENCY, CHAT_ID, TG_BOT_API_TOKEN, MESSAGE_THREAD_ID
-from sql import get_all_rows, drop_rows, save_to_db, get_rows, drop_row_by_msg_id, get_outdated_props
-from get_data import save_data
-from utils import chose_next_notification, notify, get_time_left_s
+from settings import (
+    NOTIFIER_FREQUENCY, NOTIFIER_DIGEST, NOTIFIER_EDIT_IN_PLACE, STARTUP_TIME_TARGET, TG_BOT_API_TOKEN,
+    INGEST_TIMEOUT, INGEST_QUEUE_SIZE, CLEANUP_FREQUENCY
+)
+from sql import (
+    get_due_rows, get_open_rows, drop_rows, get_outdated_props, get_digest, create_table, save_proposals, reschedule
+)
+from get_data import save_data, ingest_network
+from registry import REGISTRY
+from http_client import create_session
+from outbox import Outbox
+from reminders import reminders
+from metrics import REMINDERS_DUE, STAGE_SECONDS, timer, start_server
+from tracing import cycle, span, install_signal_handler
+from utils import chose_next_notification, notify, notify_digest, get_time_left_s, get_tier
 import telegram
 import asyncio
 
@@ -12,61 +23,213 @@ import logging
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
 
-async def notifier(telegram_bot, _row):
+def notifier(outbox, _row):
     if int(time.time()) >= _row[5]:
         time_left_s = get_time_left_s(_row)
+        tier = get_tier(time_left_s)
+        next_notification = chose_next_notification(time_left_s)
+        if _row[0] not in REGISTRY or tier is None:
+            # Network removed from the config, or voting ends later than any
+            # reminder mode covers: nothing to send yet
+            reschedule(_row, next_notification)
+            reminders.push(next_notification)
+            return
         msg = notify(_row, time_left_s)
-        t_msg = await telegram_bot.send_message(CHAT_ID, msg, parse_mode="markdown", message_thread_id=MESSAGE_THREAD_ID)
-        logging.info(t_msg.text)
-        record = list(_row[:5])
-        record.extend([
-                chose_next_notification(time_left_s),
-                t_msg.message_id
-            ])
-        save_to_db(record)
-        records = get_rows(_row[0], _row[1])
-        message_to_delete = min(x[6] for x in records)
-        try:
-            await telegram_bot.delete_message(chat_id=CHAT_ID, message_id=message_to_delete)
-        except Exception as e:
-            logging.error(f'Notification error: {e}')
-            pass
-        drop_row_by_msg_id(_row[0], _row[1], message_to_delete)
+        if NOTIFIER_EDIT_IN_PLACE and _row[6] and _row[8] == tier:
+            # Same tier as the live message, only its text needs refreshing
+            outbox.edit_reminder(_row, msg, next_notification)
+        else:
+            # The outbox sends it, stores the new message and deletes the previous one
+            outbox.send_reminder(_row, msg, next_notification, tier)
+        reminders.push(next_notification)
     else:
         pass
 
 
-async def processor(telegram_bot):
+def open_digest_rows():
+    # One entry per reminder even if older modes left several rows behind
+    return list({(row[0], row[1], row[7]): row for row in get_open_rows(int(time.time()))}.values())
+
+
+def render_digest(rows):
+    # Rows of networks removed from the config are rescheduled but not listed
+    listed = [row for row in rows if row[0] in REGISTRY]
+    return notify_digest(listed) if listed else []
+
+
+def digest_notifier(outbox):
+    """
+    Replace the previous digest with one listing every open reminder
+
+    All listed rows are rescheduled to one shared time, the soonest any of
+    them asks for, so the next digest again covers all of them instead of
+    every row falling due, and sending a digest, on its own.
+    """
+    rows = open_digest_rows()
+    if not rows:
+        return
+    next_digest = min(chose_next_notification(get_time_left_s(row)) for row in rows)
+    outbox.send_digest(render_digest(rows), [(next_digest, row[0], row[1], row[7]) for row in rows])
+    reminders.push(next_digest)
+
+
+def cleanup(outbox):
     outdated_props = get_outdated_props()
     if outdated_props:
-        msgs_to_delete = [x[6] for x in outdated_props]
-        for msg in msgs_to_delete:
-            try:
-                await telegram_bot.delete_message(chat_id=CHAT_ID, message_thread_id=MESSAGE_THREAD_ID, message_id=msg)
-            except Exception as e:
-                logging.error(f'Msg deleting error: {e}')
-                pass
+        outbox.delete_messages(x[6] for x in outdated_props)
     drop_rows()
-    await save_data()
-    rows = get_all_rows()
-    for row in rows:
-        await notifier(telegram_bot, row)
-    logging.info("All records have been checked and processed")
+    if NOTIFIER_DIGEST and outdated_props and get_digest():
+        # Drop the ended or voted proposals from the live digest, or the digest
+        # itself once nothing is left to vote on
+        outbox.send_digest(render_digest(open_digest_rows()), [])
 
 
-async def async_func(telegram_bot):
-    await save_data()
+def dispatch(outbox):
+    rows = get_due_rows(int(time.time()))
+    REMINDERS_DUE.labels().inc(len(rows))
+    if NOTIFIER_DIGEST:
+        if rows:
+            digest_notifier(outbox)
+    else:
+        with span('notifier'):
+            for row in rows:
+                try:
+                    notifier(outbox, row)
+                except Exception as e:
+                    # Reschedule it, a row failing on every dispatch must not hold back the others
+                    logging.error(f"Reminder for {row[0]} proposal {row[1]} failed: {e}")
+                    next_notification = chose_next_notification(get_time_left_s(row))
+                    reschedule(row, next_notification)
+                    reminders.push(next_notification)
+    logging.info(f"All records have been checked and processed, {outbox.depth} Telegram calls queued")
+
+
+async def processor(outbox, session):
+    with timer(STAGE_SECONDS, 'processor', ''), cycle('processor'):
+        cleanup(outbox)
+        await save_data(session)
+        dispatch(outbox)
+        reminders.reload()
+
+
+async def ingester(session, network, ingested, swept):
+    """
+    Polls one network right away and then every NOTIFIER_FREQUENCY, a hanging
+    or failing chain only delays its own rows. `swept` is set once the first
+    sweep is queued or given up on.
+    """
     while True:
-        await processor(telegram_bot)
+        try:
+            with timer(STAGE_SECONDS, 'ingestion', network.name), cycle('ingestion', network.name):
+                rows = await asyncio.wait_for(ingest_network(session, network), INGEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.error(f"Sweep of {network.name} took longer than {INGEST_TIMEOUT}s, skipping it")
+        except Exception as e:
+            logging.error(f"Sweep of {network.name} failed: {e}")
+        else:
+            # Waits when reconciliation falls behind instead of piling up sweeps
+            await ingested.put(rows)
+        swept.set()
         await asyncio.sleep(NOTIFIER_FREQUENCY)
 
 
-async def main(telegram_bot):
-    task = asyncio.create_task(async_func(telegram_bot))
+async def reconciler(ingested):
+    """Writes swept rows to the database and reschedules the reminders"""
+    while True:
+        rows = await ingested.get()
+        try:
+            with timer(STAGE_SECONDS, 'reconciliation', ''), cycle('reconciliation'):
+                save_proposals(rows)
+                reminders.reload()
+        except Exception as e:
+            logging.error(f"Saving swept proposals failed: {e}")
+        finally:
+            ingested.task_done()
+
+
+async def dispatcher(outbox, cleanups):
+    """Sends reminders the moment they fall due and asks for cleanup when voting ends"""
+    while True:
+        await reminders.wait()
+        try:
+            with timer(STAGE_SECONDS, 'dispatch', ''), cycle('dispatch'):
+                dispatch(outbox)
+        except Exception as e:
+            logging.error(f"Reminder dispatch failed: {e}")
+        if cleanups.empty():
+            cleanups.put_nowait(None)
+
+
+async def cleaner(outbox, cleanups):
+    """Deletes messages of ended or voted proposals, on request or every CLEANUP_FREQUENCY"""
+    while True:
+        try:
+            await asyncio.wait_for(cleanups.get(), CLEANUP_FREQUENCY)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            with timer(STAGE_SECONDS, 'cleanup', ''), cycle('cleanup'):
+                cleanup(outbox)
+        except Exception as e:
+            logging.error(f"Cleanup failed: {e}")
+
+
+async def run_stages(outbox, session, started_at):
+    """
+    Ingestion, reconciliation, dispatch and cleanup run concurrently, linked
+    by bounded queues, so a slow stage cannot hold up the others
+
+    Reminders already in the database are dispatched right away, the first
+    sweep of every network runs in its ingester under INGEST_TIMEOUT.
+    """
+    ingested = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    cleanups = asyncio.Queue(maxsize=1)
+    sweeps = [asyncio.Event() for _ in REGISTRY]
+    reminders.reload()
+    await asyncio.gather(
+        *(ingester(session, network, ingested, swept) for network, swept in zip(REGISTRY.values(), sweeps)),
+        reconciler(ingested),
+        dispatcher(outbox, cleanups),
+        cleaner(outbox, cleanups),
+        log_startup_time(started_at, sweeps, ingested)
+    )
+
+
+async def log_startup_time(started_at, sweeps, ingested):
+    """Logs how long it took until every network was swept once and saved"""
+    for swept in sweeps:
+        await swept.wait()
+    await ingested.join()
+    startup_time = time.monotonic() - started_at
+    if startup_time > STARTUP_TIME_TARGET:
+        logging.warning(f"Startup took {startup_time:.1f}s, target is {STARTUP_TIME_TARGET}s")
+    else:
+        logging.info(f"Startup took {startup_time:.1f}s")
+
+
+async def async_func(telegram_bot, started_at):
+    metrics_server = await start_server()
+    install_signal_handler()
+    create_table()
+    # Telegram calls left over from a previous run are resumed right away
+    outbox = Outbox(telegram_bot)
+    outbox.start()
+    # One HTTP client for the whole run, so cycles reuse warm connections
+    try:
+        async with create_session() as session:
+            await run_stages(outbox, session, started_at)
+    finally:
+        await outbox.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
+
+
+async def main(telegram_bot, started_at):
+    task = asyncio.create_task(async_func(telegram_bot, started_at))
     await task
 
 
 if __name__ == "__main__":
+    started_at = time.monotonic()
     telegram_bot = telegram.Bot(token=TG_BOT_API_TOKEN)
-    rows = get_all_rows()
-    asyncio.run(main(telegram_bot))
+    asyncio.run(main(telegram_bot, started_at))
@@ -0,0 +1,227 @@
+"""
+Rate-limited, persistent queue of outgoing Telegram calls
+
+Reminders and message deletions are written to the `outbox` table before they
+are attempted and removed only once Telegram has answered, so a restart picks
+up what was pending instead of losing or repeating reminders. A few workers
+drain the queue concurrently within Telegram's global and per-group limits and
+wait out RetryAfter answers instead of failing.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Iterable, List, Optional, Set
+
+import telegram
+from telegram.error import BadRequest, RetryAfter
+
+from settings import (
+    CHAT_ID, MESSAGE_THREAD_ID, TELEGRAM_GLOBAL_LIMIT, TELEGRAM_CHAT_LIMIT, OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS
+)
+from metrics import OUTBOX_DEPTH, REMINDERS_SENT, TELEGRAM_SECONDS, TELEGRAM_ERRORS, TELEGRAM_RETRY_AFTER, timer
+from sql import (
+    get_outbox, get_rows, enqueue_reminder, enqueue_digest, enqueue_deletes, record_sent, record_digest,
+    resend_outbox_job, complete_outbox_job, fail_outbox_job
+)
+
+logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+
+# Longest pause between attempts of a failing send, seconds
+MAX_RETRY_DELAY = 60
+
+# Bot API method behind every job kind, for metrics
+BOT_METHODS = {'send': 'send_message', 'digest': 'send_message', 'edit': 'edit_message_text', 'delete': 'delete_message'}
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per `period` seconds, up to `rate` of them in a burst
+    """
+
+    def __init__(self, rate: int, period: float):
+        self.capacity = rate
+        self.fill_rate = rate / period
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        # Waiters are served one at a time, in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+
+class Outbox:
+    """
+    Queue of pending Telegram calls, one job per `outbox` table row
+
+    Jobs are `outbox` rows: (id, kind, network, prop_id, voter, text, msg_id,
+    next_notification, attempts, tier), kind being 'send', 'edit', 'digest'
+    or 'delete'.
+    """
+
+    def __init__(self, telegram_bot: telegram.Bot):
+        self.bot = telegram_bot
+        self._global = TokenBucket(*TELEGRAM_GLOBAL_LIMIT)
+        self._chat = TokenBucket(*TELEGRAM_CHAT_LIMIT)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        # Failed sends waiting out their backoff outside of the queue
+        self._retries: Set[asyncio.TimerHandle] = set()
+
+    @property
+    def depth(self) -> int:
+        """Jobs queued, being sent or waiting to be retried right now"""
+        return (self._queue.qsize() if self._queue else 0) + self._in_flight + len(self._retries)
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        for job in get_outbox():
+            self._queue.put_nowait(job)
+        if self._queue.qsize():
+            logging.info(f"Outbox: resuming {self._queue.qsize()} pending Telegram calls")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(OUTBOX_WORKERS)]
+        OUTBOX_DEPTH.labels().set_function(lambda: self.depth)
+
+    async def stop(self):
+        # Pending retries stay in the outbox table and are resumed on start
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self):
+        """Wait until every queued call has been made, retries included"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.sleep(max(0.0, min(handle.when() for handle in self._retries) - loop.time()))
+
+    def send_reminder(self, row, text: str, next_notification: int, tier: Optional[str] = None):
+        self._queue.put_nowait(enqueue_reminder(row, text, next_notification, tier))
+
+    def edit_reminder(self, row, text: str, next_notification: int):
+        """Refresh the text of the row's live message instead of sending a new one"""
+        self._queue.put_nowait(enqueue_reminder(row, text, next_notification, row[8], kind='edit'))
+
+    def send_digest(self, parts: List[str], schedule):
+        for job in enqueue_digest(parts, schedule):
+            self._queue.put_nowait(job)
+
+    def delete_messages(self, msg_ids: Iterable[int]):
+        for job in enqueue_deletes(msg_ids):
+            self._queue.put_nowait(job)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._run(job)
+            except Exception as e:
+                logging.error(f"Outbox job {job[0]} failed: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _send(self, text: str) -> telegram.Message:
+        with timer(TELEGRAM_SECONDS, 'send_message'):
+            t_msg = await self.bot.send_message(
+                CHAT_ID, text, parse_mode="markdown", message_thread_id=MESSAGE_THREAD_ID
+            )
+        logging.info(t_msg.text)
+        return t_msg
+
+    async def _run(self, job):
+        job_id, kind, network, prop_id, voter, text, msg_id = job[:7]
+        if kind in ('send', 'edit'):
+            rows = get_rows(network, prop_id, voter)
+            if not rows or any(row[4] == 1 for row in rows):
+                # Voted on or expired while the reminder was waiting
+                complete_outbox_job(job_id)
+                return
+        if kind != 'delete':
+            await self._chat.acquire()
+        await self._global.acquire()
+        try:
+            if kind == 'send':
+                t_msg = await self._send(text)
+                for delete_job in record_sent(job_id, t_msg.message_id):
+                    self._queue.put_nowait(delete_job)
+            elif kind == 'edit':
+                with timer(TELEGRAM_SECONDS, 'edit_message_text'):
+                    await self.bot.edit_message_text(text, CHAT_ID, msg_id, parse_mode="markdown")
+                complete_outbox_job(job_id)
+            elif kind == 'digest':
+                t_msg = await self._send(text)
+                record_digest(job_id, t_msg.message_id)
+            else:
+                with timer(TELEGRAM_SECONDS, 'delete_message'):
+                    await self.bot.delete_message(chat_id=CHAT_ID, message_id=msg_id)
+                complete_outbox_job(job_id)
+            if kind != 'delete':
+                REMINDERS_SENT.labels(kind).inc()
+        except RetryAfter as e:
+            TELEGRAM_RETRY_AFTER.labels().inc()
+            logging.warning(f"Telegram flood control, pausing the outbox for {e.retry_after}s")
+            self._global.pause(e.retry_after)
+            self._chat.pause(e.retry_after)
+            self._queue.put_nowait(job)
+        except BadRequest as e:
+            TELEGRAM_ERRORS.labels(BOT_METHODS[kind]).inc()
+            if kind != 'edit':
+                self._failed(job, e)
+            elif 'not modified' in str(e):
+                complete_outbox_job(job_id)
+            else:
+                # The live message was deleted or can no longer be edited
+                logging.warning(f'Msg editing error, sending a new one: {e}')
+                self._queue.put_nowait(resend_outbox_job(job_id))
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(BOT_METHODS[kind]).inc()
+            self._failed(job, e)
+
+    def _retry(self, job, delay: float):
+        """Queue the job again after `delay` seconds without holding a worker"""
+        def requeue():
+            self._retries.discard(handle)
+            self._queue.put_nowait(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    def _failed(self, job, e: Exception):
+        job_id, kind = job[:2]
+        if kind == 'delete':
+            # Most likely already deleted or too old to delete, not worth retrying
+            logging.error(f'Msg deleting error: {e}')
+            complete_outbox_job(job_id)
+            return
+        attempts = fail_outbox_job(job_id)
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            logging.error(f'Notification error, giving up after {attempts} attempts: {e}')
+            complete_outbox_job(job_id)
+            return
+        logging.error(f'Notification error, attempt {attempts}: {e}')
+        self._retry(job, min(MAX_RETRY_DELAY, 2 ** attempts))
@@ -0,0 +1,124 @@
+"""
+Network registry compiled once from NETWORKS in the config
+
+Everything that used to be re-derived from the raw config dict for every
+proposal (voter address, gov prefix, endpoint list, URLs) is computed here a
+single time, and networks are looked up by name in a dict.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+from settings import NETWORKS, PROPOSALS_PAGE_LIMIT, HEDGING_ENABLED, HEDGE_BUDGET_RATIO, HEDGE_BUDGET_BURST
+from _wallet import address_to_address
+from endpoint_health import HedgeBudget
+from http_client import network_timeout
+from namada_provider import NamadaProvider
+
+logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+
+
+class Network:
+    """
+    Compiled view of a single NETWORKS entry
+    """
+
+    def __init__(self, network: Dict[str, Any]):
+        """
+        Args:
+            network: Raw network dictionary from the config
+        """
+        self.config = network
+        self.name = network['name']
+        self.provider = network.get('provider', 'cosmos')
+        self.gov_prefix = network.get('gov_prefix', 'cosmos')
+        self.gov_version = network.get('gov_version')
+        self.explorer = network.get('explorer', '')
+        self.timeout = network_timeout(network)
+
+        # Voting address -> validator address shown in reminders. Both are the
+        # same on Namada, Cosmos validators vote with their account address
+        self.validators: Dict[str, str] = {}
+        self.namada = None
+        if self.provider == 'namada':
+            self.endpoints = tuple(network.get('indexers', []))
+            for validator in network.get('validator_addresses') or [network.get('validator_address', '')]:
+                self.validators[validator] = validator
+            # One provider per network, so its per-cycle vote cache is shared
+            self.namada = NamadaProvider(network)
+        else:
+            # Support both single lcd_api and multiple lcd_endpoints
+            if network.get('lcd_api'):
+                self.endpoints = tuple(network.get('lcd_endpoints', [network['lcd_api']]))
+            else:
+                self.endpoints = tuple(network.get('lcd_endpoints', []))
+            # Support both single validator and multiple validators
+            for validator in network.get('validators') or [network['validator']]:
+                self.validators[address_to_address(validator, network['prefix'])] = validator
+        self.voters = tuple(self.validators)
+
+        # Hedging only makes sense with a second endpoint to hedge onto
+        self.hedge_budget = None
+        if network.get('hedging', HEDGING_ENABLED) and len(self.endpoints) > 1:
+            self.hedge_budget = HedgeBudget(
+                network.get('hedge_budget_ratio', HEDGE_BUDGET_RATIO),
+                network.get('hedge_budget_burst', HEDGE_BUDGET_BURST)
+            )
+
+        self._proposals_url = (
+            "{endpoint}/{gov_prefix}/gov/{api_version}/proposals?proposal_status=2"
+            + f"&pagination.limit={network.get('page_limit', PROPOSALS_PAGE_LIMIT)}"
+        )
+        self._vote_url = "{endpoint}/{gov_prefix}/gov/{api_version}/proposals/{prop_id}/votes/{voter}"
+
+    @property
+    def is_namada(self) -> bool:
+        return self.provider == 'namada'
+
+    def proposals_url(
+        self,
+        endpoint: str,
+        api_version: str = 'v1beta1',
+        next_key: Optional[str] = None,
+        gov_prefix: Optional[str] = None
+    ) -> str:
+        url = self._proposals_url.format(
+            endpoint=endpoint, gov_prefix=gov_prefix or self.gov_prefix, api_version=api_version
+        )
+        if next_key:
+            url += f"&pagination.key={quote(next_key, safe='')}"
+        return url
+
+    def vote_url(
+        self,
+        endpoint: str,
+        prop_id: int,
+        voter: str,
+        api_version: str = 'v1beta1',
+        gov_prefix: Optional[str] = None
+    ) -> str:
+        return self._vote_url.format(
+            endpoint=endpoint, gov_prefix=gov_prefix or self.gov_prefix, api_version=api_version,
+            prop_id=prop_id, voter=voter
+        )
+
+    def explorer_url(self, prop_id: int) -> str:
+        return f"{self.explorer}{prop_id}"
+
+
+def compile_networks(networks: List[Dict[str, Any]]) -> Dict[str, Network]:
+    registry = {}
+    for network in networks:
+        if network['name'] in registry:
+            # The first entry is the one lookups by name always returned
+            logging.warning(f"Duplicate network {network['name']} in NETWORKS, ignoring the later entry")
+            continue
+        try:
+            registry[network['name']] = Network(network)
+        except ValueError as e:
+            logging.error(f"Skipping misconfigured network {network['name']}: {e}")
+    return registry
+
+
+REGISTRY = compile_networks(NETWORKS)
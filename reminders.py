@@ -0,0 +1,64 @@
+"""
+In-process timer for reminder dispatch
+
+Instead of checking for due reminders once per NOTIFIER_FREQUENCY, the bot
+keeps a heap with the `next_notification` and `voting_end_time` of every open
+reminder and sleeps exactly until the earliest one. Chain polling only has to
+keep the rows up to date, reminder precision no longer depends on it.
+"""
+
+import asyncio
+import heapq
+import time
+from typing import List, Optional
+
+from sql import get_open_rows
+
+
+class ReminderScheduler:
+    """
+    Heap of the moments a reminder falls due or a proposal's voting ends
+
+    Entries are plain timestamps, the database stays the source of truth for
+    what is due, so an entry left behind by a changed row only costs an
+    empty dispatch.
+    """
+
+    def __init__(self):
+        self._heap: List[int] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def next_event(self) -> Optional[int]:
+        return self._heap[0] if self._heap else None
+
+    def push(self, when: int):
+        heapq.heappush(self._heap, when)
+        if self._heap[0] == when:
+            # Earlier than what the dispatcher is sleeping for
+            self._changed.set()
+
+    def reload(self):
+        """Rebuild the heap from the open reminders in the database"""
+        rows = get_open_rows(int(time.time()))
+        self._heap = [row[5] for row in rows] + [row[3] for row in rows]
+        heapq.heapify(self._heap)
+        self._changed.set()
+
+    async def wait(self):
+        """Sleep until the earliest event is due and drop every due event"""
+        while True:
+            self._changed.clear()
+            now = time.time()
+            if self._heap and self._heap[0] <= now:
+                while self._heap and self._heap[0] <= now:
+                    heapq.heappop(self._heap)
+                return
+            timeout = self._heap[0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+reminders = ReminderScheduler()
@@ -0,0 +1,164 @@
+"""
+Bounded, priority-ordered scheduling of outgoing HTTP requests
+
+Every LCD and indexer request goes through `scheduler.get`, which caps the
+number of requests in flight globally and per host, hands free slots to the
+most urgent request first (lowest priority value, e.g. the earliest
+voting_end_time) and pauses a host that answered with HTTP 429.
+
+A caller timing a request, like `call_endpoints`, sets a RequestClock in
+`request_clock` so the time spent waiting for a slot is not counted as the
+endpoint's latency.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from settings import (
+    FETCH_CONCURRENCY, FETCH_CONCURRENCY_PER_HOST, RATE_LIMIT_RETRIES, RATE_LIMIT_BACKOFF, RATE_LIMIT_MAX_PAUSE
+)
+
+logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+
+
+class PrioritySemaphore:
+    """
+    Semaphore whose waiters are woken lowest priority value first
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: float = 0):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over right before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: float = 0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class RequestClock:
+    """
+    When the request of an attempt got its slot, None while it is still queued
+    """
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.granted = asyncio.get_running_loop().create_future()
+
+    def start(self):
+        # Later requests of the same attempt keep the first start
+        if self.started is None:
+            self.started = time.monotonic()
+            self.granted.set_result(None)
+
+    def elapsed(self) -> float:
+        return 0.0 if self.started is None else time.monotonic() - self.started
+
+
+request_clock: ContextVar[Optional[RequestClock]] = ContextVar('request_clock', default=None)
+
+
+def retry_after(resp: aiohttp.ClientResponse) -> float:
+    try:
+        return float(resp.headers.get('Retry-After', RATE_LIMIT_BACKOFF))
+    except ValueError:
+        # Retry-After may also be an HTTP date, fall back to the default pause
+        return RATE_LIMIT_BACKOFF
+
+
+class FetchScheduler:
+    """
+    Global and per-host request limits with HTTP 429 backpressure
+    """
+
+    def __init__(self, limit: int, per_host_limit: int):
+        self._global = PrioritySemaphore(limit)
+        self._hosts: Dict[str, PrioritySemaphore] = defaultdict(lambda: PrioritySemaphore(per_host_limit))
+        self._paused_until: Dict[str, float] = {}
+
+    async def _wait_for_host(self, host: str):
+        while (delay := self._paused_until.get(host, 0) - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def backoff(self, host: str, seconds: float):
+        self._paused_until[host] = max(self._paused_until.get(host, 0), time.monotonic() + seconds)
+        logging.warning(f"Rate limited by {host}, pausing requests to it for {seconds:.0f}s")
+
+    @asynccontextmanager
+    async def slot(self, url: str, priority: float = 0):
+        host = urlsplit(url).netloc
+        while True:
+            await self._wait_for_host(host)
+            # Host first, so a busy host does not hold global slots while it waits
+            async with self._hosts[host].slot(priority):
+                if self._paused_until.get(host, 0) > time.monotonic():
+                    # Paused while this request was queued, wait again without the slot
+                    continue
+                async with self._global.slot(priority):
+                    yield
+                    return
+
+    @asynccontextmanager
+    async def get(self, session: aiohttp.ClientSession, url: str, priority: float = 0, **kwargs):
+        """
+        Drop-in for `session.get` that waits for a slot and retries on HTTP 429
+
+        The response of the last attempt is returned even if it is still 429.
+        A Retry-After longer than RATE_LIMIT_MAX_PAUSE is not waited out: the
+        host is paused for RATE_LIMIT_MAX_PAUSE and the 429 is returned right
+        away, so the caller can fail over to another endpoint.
+        """
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            async with self.slot(url, priority):
+                if (clock := request_clock.get()) is not None:
+                    clock.start()
+                async with session.get(url, **kwargs) as resp:
+                    if resp.status == 429:
+                        pause = retry_after(resp)
+                        self.backoff(host, min(pause, RATE_LIMIT_MAX_PAUSE))
+                        if attempt < RATE_LIMIT_RETRIES and pause <= RATE_LIMIT_MAX_PAUSE:
+                            attempt += 1
+                            continue
+                    yield resp
+                    return
+
+
+scheduler = FetchScheduler(FETCH_CONCURRENCY, FETCH_CONCURRENCY_PER_HOST)
@@ -0,0 +1,15 @@
+"""
+Bot settings
+
+The defaults of data/config.py overridden by the user's data/my_config.py, so
+a my_config.py written for an older release keeps working when new settings
+are added. Bot modules import their settings from here.
+"""
+
+from data.config import *  # noqa: F401,F403
+
+try:
+    from data.my_config import *  # noqa: F401,F403
+except ModuleNotFoundError as e:
+    if e.name != 'data.my_config':
+        raise
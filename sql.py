@@ -1,99 +1,445 @@
 import sqlite3
 import time
+import logging
+from functools import wraps
 
 
-from data.my_config import SQL_PATH
+from settings import SQL_PATH
+from metrics import SQL_SECONDS
+from tracing import span
+
+
+class Storage:
+    """
+    Single long-lived SQLite connection shared by the whole bot.
+
+    The connection is opened lazily on first use, switched to WAL mode and kept
+    open for the lifetime of the process, so a processor cycle no longer pays
+    a connect/commit/close round-trip for every query.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",
+        "PRAGMA busy_timeout=5000",
+    )
+
+    def __init__(self, path, cached_statements=128):
+        self.path = path
+        self.cached_statements = cached_statements
+        self._con = None
+
+    @property
+    def con(self):
+        if self._con is None:
+            # sqlite3 keeps up to `cached_statements` prepared statements per
+            # connection, so constant SQL strings below are compiled only once
+            self._con = sqlite3.connect(self.path, cached_statements=self.cached_statements)
+            for pragma in self.PRAGMAS:
+                self._con.execute(pragma)
+        return self._con
+
+    def close(self):
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    def execute(self, query, params=()):
+        cur = self.con.execute(query, params)
+        self.con.commit()
+        return cur
+
+    def fetchall(self, query, params=()):
+        return self.con.execute(query, params).fetchall()
+
+
+storage = Storage(SQL_PATH)
+
+
+def timed(func):
+    """Report the duration of a database operation under the function name"""
+    @wraps(func)
+    def with_timing(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            with span(f"sql.{func.__name__}"):
+                return func(*args, **kwargs)
+        finally:
+            SQL_SECONDS.labels(func.__name__).observe(time.monotonic() - started)
+    return with_timing
 
 
 def connection_wrapper(func):
-    def open_close_connection(*args, **kwargs):
-        con = sqlite3.connect(SQL_PATH)
-        cur = con.cursor()
-        func(cur, *args, **kwargs)
-        con.commit()
-        con.close()
-    return open_close_connection
+    @wraps(func)
+    def with_shared_connection(*args, **kwargs):
+        cur = storage.con.cursor()
+        result = func(cur, *args, **kwargs)
+        storage.con.commit()
+        return result
+    return with_shared_connection
 
 
-@connection_wrapper
-def create_table(cur):
-    try:
-        cur.execute('''CREATE TABLE proposals(
-            network text, 
-            prop_id int, 
-            title text, 
-            voting_end_time int, 
+def backfill_voters(con):
+    # Imported lazily, only this one-off migration needs the network config
+    from registry import REGISTRY
+    con.executemany(
+        "UPDATE proposals SET voter = ? WHERE network = ? AND voter IS NULL",
+        ((network.voters[0], network.name) for network in REGISTRY.values() if network.voters)
+    )
+
+
+# Schema migrations, applied in order. The index of a migration + 1 is the
+# schema version stored in `PRAGMA user_version` once it has been applied.
+MIGRATIONS = (
+    # 1: initial schema, identical to the table older releases created
+    (
+        """CREATE TABLE IF NOT EXISTS proposals(
+            network text,
+            prop_id int,
+            title text,
+            voting_end_time int,
             option bool,
             next_notification int,
             msg_id int
-        )''')
-    except sqlite3.OperationalError as er:
-        pass
+        )""",
+    ),
+    # 2: unique key and indexes for the lookups done every cycle
+    (
+        """DELETE FROM proposals WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM proposals GROUP BY network, prop_id, msg_id
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS proposals_key ON proposals(network, prop_id, msg_id)",
+        "CREATE INDEX IF NOT EXISTS proposals_next_notification ON proposals(next_notification)",
+        "CREATE INDEX IF NOT EXISTS proposals_voting_end_time ON proposals(voting_end_time)",
+    ),
+    # 3: proposals the voter is known to have voted on, kept until voting ends
+    (
+        """CREATE TABLE IF NOT EXISTS voted(
+            network text,
+            prop_id int,
+            voter text,
+            voting_end_time int,
+            PRIMARY KEY (network, prop_id, voter)
+        )""",
+    ),
+    # 4: reminder rows are tracked per voter, existing rows belong to the
+    # single validator a network used to have
+    (
+        "ALTER TABLE proposals ADD COLUMN voter text",
+        backfill_voters,
+        "DROP INDEX IF EXISTS proposals_key",
+        "CREATE UNIQUE INDEX IF NOT EXISTS proposals_voter_key ON proposals(network, prop_id, voter, msg_id)",
+    ),
+    # 5: Telegram calls waiting in the outbox, kept across restarts
+    (
+        """CREATE TABLE IF NOT EXISTS outbox(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind text,
+            network text,
+            prop_id int,
+            voter text,
+            text text,
+            msg_id int,
+            next_notification int,
+            attempts int DEFAULT 0
+        )""",
+    ),
+    # 6: messages of the latest digest, replaced as a whole by the next one
+    (
+        "CREATE TABLE IF NOT EXISTS digest(msg_id int PRIMARY KEY)",
+    ),
+    # 7: reminder tier of the live message, so it can be edited until the tier changes
+    (
+        "ALTER TABLE proposals ADD COLUMN tier text",
+        "ALTER TABLE outbox ADD COLUMN tier text",
+    ),
+)
 
+# Columns filled by `save_to_db` rows, tier is only known once a reminder is sent
+ROW_COLUMNS = "network, prop_id, title, voting_end_time, option, next_notification, msg_id, voter"
+
+
+
+def get_schema_version():
+    return storage.fetchall("PRAGMA user_version")[0][0]
+
+
+def migrate():
+    """
+    Bring the database schema up to the latest version
+
+    Every pending migration runs in its own transaction together with the
+    version bump, so an interrupted upgrade is simply retried on next start.
+    """
+    version = get_schema_version()
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        with storage.con:
+            storage.con.execute("BEGIN")
+            for statement in statements:
+                if callable(statement):
+                    statement(storage.con)
+                else:
+                    storage.con.execute(statement)
+            storage.con.execute(f"PRAGMA user_version = {number}")
+        logging.info(f"Database schema migrated to version {number}")
+
+
+def create_table():
+    migrate()
 
-@connection_wrapper
-def save_to_db(cur, data):
-    cur.execute("insert into proposals values (?, ?, ?, ?, ?, ?, ?)", tuple(data))
 
+@timed
+def save_to_db(data):
+    storage.execute(f"insert into proposals ({ROW_COLUMNS}) values (?, ?, ?, ?, ?, ?, ?, ?)", tuple(data))
 
-def check_dublicates(network, prop_id):
-    con = sqlite3.connect(SQL_PATH)
-    cur = con.cursor()
-    cur.execute("SELECT * FROM proposals WHERE network=? AND prop_id=?", (network, prop_id))
-    fetched_data = cur.fetchall()
-    if not fetched_data:
-        return False
-    else:
-        return True
-    con.commit()
-    con.close()
 
+@timed
+def save_proposals(rows):
+    """
+    Write a whole sweep of fetched proposals in one transaction
 
-def get_rows(network, prop_id):
-    con = sqlite3.connect(SQL_PATH)
-    cur = con.cursor()
-    cur.execute("SELECT * FROM proposals WHERE network=? AND prop_id=?", (network, prop_id))
-    fetched_data = cur.fetchall().copy()
-    con.commit()
-    con.close()
-    return fetched_data
+    Proposals already tracked get their title and voting end time refreshed,
+    new ones are inserted. Rows are in the `save_to_db` format.
+    """
+    rows = [tuple(row) for row in rows]
+    with storage.con:
+        storage.con.executemany(
+            """UPDATE proposals SET title = ?, voting_end_time = ?
+            WHERE network = ? AND prop_id = ? AND voter = ? AND (title IS NOT ? OR voting_end_time IS NOT ?)""",
+            ((row[2], row[3], row[0], row[1], row[7], row[2], row[3]) for row in rows)
+        )
+        storage.con.executemany(
+            f"""INSERT INTO proposals ({ROW_COLUMNS}) SELECT ?, ?, ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM proposals WHERE network = ? AND prop_id = ? AND voter = ?)""",
+            (row + (row[0], row[1], row[7]) for row in rows)
+        )
 
 
+@timed
+def check_dublicates(network, prop_id, voter):
+    fetched_data = storage.fetchall(
+        "SELECT 1 FROM proposals WHERE network=? AND prop_id=? AND voter=? LIMIT 1", (network, prop_id, voter)
+    )
+    return bool(fetched_data)
+
+
+@timed
+def get_rows(network, prop_id, voter):
+    return storage.fetchall(
+        "SELECT * FROM proposals WHERE network=? AND prop_id=? AND voter=?", (network, prop_id, voter)
+    )
+
+
+@timed
 @connection_wrapper
 def drop_rows(cur):
     current_time = int(time.time())
     cur.execute("""DELETE from proposals where voting_end_time < ?""", (current_time,))
     cur.execute("""DELETE from proposals where option = 1""")
+    cur.execute("""DELETE from voted where voting_end_time < ?""", (current_time,))
 
 
-@connection_wrapper
-def get_outdated_props(cur):
+@timed
+def get_outdated_props():
     current_time = int(time.time())
-    cur.execute("SELECT * FROM proposals WHERE voting_end_time < ? OR option = 1", (current_time,))
-    fetched_data = cur.fetchall().copy()
-    return fetched_data
+    return storage.fetchall("SELECT * FROM proposals WHERE voting_end_time < ? OR option = 1", (current_time,))
 
 
-def drop_row_by_msg_id(network, prop_id, msg_id):
-    con = sqlite3.connect(SQL_PATH)
-    cur = con.cursor()
-    cur.execute("""DELETE from proposals where msg_id = ? and network = ? and prop_id = ?""", (msg_id, network, prop_id))
-    con.commit()
-    con.close()
+@timed
+def drop_row_by_msg_id(network, prop_id, voter, msg_id):
+    storage.execute("""DELETE from proposals where msg_id = ? and network = ? and prop_id = ? and voter = ?""",
+                    (msg_id, network, prop_id, voter))
 
 
-@connection_wrapper
-def set_option(cur, network, prop_id, value):
-    cur.execute("UPDATE proposals set option = ? where network = ? and prop_id = ?",
-                (value, network, prop_id))
+@timed
+def set_option(network, prop_id, voter, value):
+    storage.execute("UPDATE proposals set option = ? where network = ? and prop_id = ? and voter = ?",
+                    (value, network, prop_id, voter))
+
+
+@timed
+def mark_voted(network, prop_id, voter, voting_end_time):
+    """
+    Flag the proposal rows as voted and remember the vote until voting ends
+    """
+    with storage.con:
+        storage.con.execute(
+            "UPDATE proposals set option = 1 where network = ? and prop_id = ? and voter = ?", (network, prop_id, voter)
+        )
+        storage.con.execute(
+            "INSERT OR REPLACE INTO voted VALUES (?, ?, ?, ?)", (network, prop_id, voter, voting_end_time)
+        )
 
 
+@timed
+def get_voted(current_time):
+    """
+    Set of (network, prop_id, voter) known to be voted on and still in voting period
+    """
+    rows = storage.fetchall(
+        "SELECT network, prop_id, voter FROM voted WHERE voting_end_time >= ?", (current_time,)
+    )
+    return set(rows)
+
+
+@timed
+def get_due_rows(current_time):
+    return storage.fetchall(
+        "SELECT * FROM proposals WHERE next_notification <= ? AND voting_end_time > ? AND option = 0",
+        (current_time, current_time)
+    )
+
+
+@timed
+def get_open_rows(current_time):
+    return storage.fetchall(
+        "SELECT * FROM proposals WHERE voting_end_time > ? AND option = 0", (current_time,)
+    )
+
+
+@timed
+def reschedule(row, next_notification):
+    storage.execute(
+        "UPDATE proposals set next_notification = ? where network = ? and prop_id = ? and voter = ?",
+        (next_notification, row[0], row[1], row[7])
+    )
+
+
+@timed
 def get_all_rows():
-    con = sqlite3.connect(SQL_PATH)
-    cur = con.cursor()
-    cur.execute("SELECT * FROM proposals")
-    fetched_data = cur.fetchall()
-    con.commit()
-    con.close()
-    return fetched_data
+    return storage.fetchall("SELECT * FROM proposals")
+
+
+@timed
+def get_outbox():
+    return storage.fetchall("SELECT * FROM outbox ORDER BY id")
+
+
+@timed
+def get_outbox_jobs(job_ids):
+    return [job for job_id in job_ids for job in storage.fetchall("SELECT * FROM outbox WHERE id = ?", (job_id,))]
+
+
+def _queue_deletes(con, msg_ids):
+    return [
+        con.execute("INSERT INTO outbox (kind, msg_id) VALUES ('delete', ?)", (msg_id,)).lastrowid
+        for msg_id in msg_ids if msg_id
+    ]
+
+
+@timed
+def enqueue_reminder(row, text, next_notification, tier=None, kind='send'):
+    """
+    Queue a reminder for the row and move its next_notification forward in
+    one transaction, so the row is not due again while the send is pending
+
+    With kind 'edit' the row's live message is updated instead of replaced.
+    """
+    network, prop_id, voter = row[0], row[1], row[7]
+    with storage.con:
+        job_id = storage.con.execute(
+            """INSERT INTO outbox (kind, network, prop_id, voter, text, msg_id, next_notification, tier)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (kind, network, prop_id, voter, text, row[6] if kind == 'edit' else None, next_notification, tier)
+        ).lastrowid
+        storage.con.execute(
+            "UPDATE proposals set next_notification = ? where network = ? and prop_id = ? and voter = ?",
+            (next_notification, network, prop_id, voter)
+        )
+    return get_outbox_jobs([job_id])[0]
+
+
+@timed
+def enqueue_digest(parts, schedule):
+    """
+    Queue the parts of a new digest and the deletion of the previous one
+
+    `schedule` holds (next_notification, network, prop_id, voter) of the rows
+    the digest reminds about, they are moved forward in the same transaction.
+    """
+    with storage.con:
+        job_ids = [
+            storage.con.execute("INSERT INTO outbox (kind, text) VALUES ('digest', ?)", (part,)).lastrowid
+            for part in parts
+        ]
+        storage.con.executemany(
+            "UPDATE proposals set next_notification = ? where network = ? and prop_id = ? and voter = ?", schedule
+        )
+        previous = [row[0] for row in storage.con.execute("SELECT msg_id FROM digest")]
+        storage.con.execute("DELETE FROM digest")
+        job_ids += _queue_deletes(storage.con, previous)
+    return get_outbox_jobs(job_ids)
+
+
+@timed
+def record_digest(job_id, msg_id):
+    with storage.con:
+        storage.con.execute("INSERT OR IGNORE INTO digest VALUES (?)", (msg_id,))
+        storage.con.execute("DELETE FROM outbox WHERE id = ?", (job_id,))
+
+
+@timed
+def get_digest():
+    """Message ids of the live digest"""
+    return [row[0] for row in storage.fetchall("SELECT msg_id FROM digest")]
+
+
+@timed
+def enqueue_deletes(msg_ids):
+    with storage.con:
+        job_ids = _queue_deletes(storage.con, msg_ids)
+    return get_outbox_jobs(job_ids)
+
+
+@timed
+def record_sent(job_id, msg_id):
+    """
+    Store the message of a delivered reminder in place of the previous ones
+
+    Returns the delete jobs queued for the replaced messages, or for the new
+    message itself when the proposal was voted on or dropped meanwhile.
+    """
+    with storage.con:
+        network, prop_id, voter, next_notification, tier = storage.con.execute(
+            "SELECT network, prop_id, voter, next_notification, tier FROM outbox WHERE id = ?", (job_id,)
+        ).fetchone()
+        rows = storage.con.execute(
+            "SELECT * FROM proposals WHERE network=? AND prop_id=? AND voter=?", (network, prop_id, voter)
+        ).fetchall()
+        if rows and all(row[4] == 0 for row in rows):
+            storage.con.execute(
+                "insert into proposals values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows[0][:5] + (next_notification, msg_id, voter, tier)
+            )
+            storage.con.execute(
+                "DELETE from proposals where network = ? and prop_id = ? and voter = ? and msg_id != ?",
+                (network, prop_id, voter, msg_id)
+            )
+            stale = [row[6] for row in rows]
+        else:
+            stale = [msg_id]
+        storage.con.execute("DELETE FROM outbox WHERE id = ?", (job_id,))
+        job_ids = _queue_deletes(storage.con, stale)
+    return get_outbox_jobs(job_ids)
+
+
+@timed
+def resend_outbox_job(job_id):
+    """Turn an edit whose message is gone into a fresh send"""
+    storage.execute("UPDATE outbox SET kind = 'send', msg_id = NULL WHERE id = ?", (job_id,))
+    return get_outbox_jobs([job_id])[0]
+
+
+@timed
+def complete_outbox_job(job_id):
+    storage.execute("DELETE FROM outbox WHERE id = ?", (job_id,))
+
 
+@timed
+def fail_outbox_job(job_id):
+    """Count a failed attempt, returns the number of attempts so far"""
+    storage.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (job_id,))
+    rows = storage.fetchall("SELECT attempts FROM outbox WHERE id = ?", (job_id,))
+    return rows[0][0] if rows else 0
@@ -0,0 +1,18 @@
+"""
+Shared setup of the tests
+
+The bot settings are pointed at a throwaway database, with metrics and
+tracing off, before any bot module is imported.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings  # noqa: E402
+
+settings.SQL_PATH = os.path.join(tempfile.mkdtemp(), 'proposals.db')
+settings.METRICS_PORT = None
+settings.TRACE_DIR = None
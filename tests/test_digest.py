@@ -0,0 +1,66 @@
+import asyncio
+import random
+import time
+
+import notifier
+import registry
+import sql
+from reminders import reminders
+
+DAY = 86_400
+VALIDATOR = "osmovaloper13tk45jkxgf7w0nxquup3suwaz2tx483xe832ge"
+
+
+class DigestOutbox:
+    """Counts the digests the dispatcher sends, storing them as the real outbox does"""
+
+    depth = 0
+
+    def __init__(self):
+        self.digests = 0
+
+    def send_digest(self, parts, schedule):
+        self.digests += 1
+        sql.enqueue_digest(parts, schedule)
+
+
+def seed(now, count):
+    registry.REGISTRY.clear()
+    registry.REGISTRY.update(registry.compile_networks([
+        {"name": "osmosis", "lcd_endpoints": [], "validator": VALIDATOR, "prefix": "osmo",
+         "explorer": "https://example.com/"}
+    ]))
+    voter = registry.REGISTRY['osmosis'].voters[0]
+    rng = random.Random(1)
+    sql.create_table()
+    with sql.storage.con:
+        sql.storage.con.execute("DELETE FROM proposals")
+        sql.storage.con.executemany(
+            f"INSERT INTO proposals ({sql.ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [("osmosis", index, f"Proposal {index}", now + rng.randint(2 * DAY, 30 * DAY), 0,
+              now + rng.randint(0, DAY), 0, voter) for index in range(count)]
+        )
+
+
+def digests_per_day(monkeypatch, count):
+    clock = [time.time()]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    monkeypatch.setattr(notifier, 'NOTIFIER_DIGEST', True)
+    seed(int(clock[0]), count)
+    outbox = DigestOutbox()
+    end = clock[0] + DAY
+    reminders.reload()
+    while reminders.next_event is not None and reminders.next_event <= end:
+        # Jump to the next timer instead of sleeping until it
+        clock[0] = max(clock[0], reminders.next_event)
+        asyncio.run(reminders.wait())
+        notifier.dispatch(outbox)
+    return outbox.digests
+
+
+def test_digests_do_not_grow_with_open_proposals(monkeypatch):
+    few = digests_per_day(monkeypatch, 30)
+    many = digests_per_day(monkeypatch, 100)
+    # Rows end 2 to 30 days out, their tiers ask for a reminder every 6 to 24 hours
+    assert few <= 6
+    assert many <= 6
@@ -0,0 +1,48 @@
+import time
+
+import notifier
+import registry
+import sql
+
+DAY = 86_400
+VALIDATOR = "osmovaloper13tk45jkxgf7w0nxquup3suwaz2tx483xe832ge"
+
+
+class ReminderOutbox:
+    depth = 0
+
+    def __init__(self):
+        self.sent = []
+
+    def send_reminder(self, row, text, next_notification, tier=None):
+        self.sent.append((row[0], row[1]))
+        sql.reschedule(row, next_notification)
+
+
+def test_a_failing_row_does_not_hold_back_the_others(monkeypatch):
+    monkeypatch.setattr(notifier, 'NOTIFIER_DIGEST', False)
+    registry.REGISTRY.clear()
+    registry.REGISTRY.update(registry.compile_networks([
+        {"name": "osmosis", "lcd_endpoints": [], "validator": VALIDATOR, "prefix": "osmo",
+         "explorer": "https://example.com/"}
+    ]))
+    voter = registry.REGISTRY['osmosis'].voters[0]
+    now = int(time.time())
+    sql.create_table()
+    with sql.storage.con:
+        sql.storage.con.execute("DELETE FROM proposals")
+        sql.storage.con.executemany(
+            f"INSERT INTO proposals ({sql.ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                # Network removed from the config
+                ("removed", 1, "Gone", now + 3 * DAY, 0, 0, 0, voter),
+                # Ends later than every reminder mode covers
+                ("osmosis", 2, "Far", now + 60 * DAY, 0, 0, 0, voter),
+                ("osmosis", 3, "Due", now + 3 * DAY, 0, 0, 0, voter),
+            ]
+        )
+    outbox = ReminderOutbox()
+    notifier.dispatch(outbox)
+    assert outbox.sent == [("osmosis", 3)]
+    # Every row was moved forward, none is due again right away
+    assert sql.get_due_rows(now) == []
@@ -0,0 +1,113 @@
+import asyncio
+import importlib.util
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import get_data
+import proposal_decoder
+import registry
+
+VALIDATOR = "osmovaloper13tk45jkxgf7w0nxquup3suwaz2tx483xe832ge"
+END = "2030-01-01T00:00:00Z"
+
+V1_PAGE = {
+    "proposals": [
+        {"id": "1", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "title": "", "metadata": "ipfs://QmProposalMetadata", "summary": "Summary of the first one"},
+        {"id": "2", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "metadata": {"title": "From metadata"}},
+        {"id": "3", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "metadata": "", "summary": None,
+         "messages": [{"@type": "/cosmos.gov.v1.MsgExecLegacyContent", "content": {"title": "Legacy content"}},
+                      {"@type": "/cosmos.bank.v1beta1.MsgSend", "content": {"title": "Second message"}}]},
+        {"id": "4", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "metadata": "ipfs://QmNoTitle", "messages": [{"@type": "/cosmos.upgrade.v1beta1.MsgSoftwareUpgrade"}]},
+        {"id": "5", "status": "PROPOSAL_STATUS_PASSED", "voting_end_time": END, "title": "Not voting"},
+    ],
+    "pagination": {"next_key": "Ag==", "total": "5"},
+}
+
+V1BETA1_PAGE = {
+    "proposals": [
+        {"proposal_id": "7", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "content": {"@type": "/cosmos.gov.v1beta1.TextProposal", "title": "Text proposal"}},
+        {"proposal_id": "8", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "content": {"@type": "/atomone.gov.v1.MsgUpdateParams"}},
+        {"proposal_id": "9", "status": "PROPOSAL_STATUS_VOTING_PERIOD", "voting_end_time": END,
+         "content": None},
+    ],
+    "pagination": {"next_key": None},
+}
+
+EXPECTED = {
+    'v1': ([
+        ["osmosis", 1, "Summary of the first one", 1893456000],
+        ["osmosis", 2, "From metadata", 1893456000],
+        ["osmosis", 3, "Legacy content", 1893456000],
+        ["osmosis", 4, "Proposal (title unavailable)", 1893456000],
+    ], "Ag=="),
+    'v1beta1': ([
+        ["osmosis", 7, "Text proposal", 1893456000],
+        ["osmosis", 8, "Update Params", 1893456000],
+        ["osmosis", 9, "Proposal (title unavailable)", 1893456000],
+    ], None),
+}
+
+
+BACKENDS = [
+    pytest.param(name, marks=pytest.mark.skipif(
+        name != 'json' and importlib.util.find_spec(name) is None, reason=f"{name} is not installed"
+    ))
+    for name in ('json', 'orjson', 'ijson')
+]
+
+
+async def decode(api_version, port):
+    page = V1_PAGE if api_version == 'v1' else V1BETA1_PAGE
+
+    async def listing(request):
+        return web.json_response(page)
+
+    app = web.Application()
+    app.router.add_get('/', listing)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'http://127.0.0.1:{port}/') as resp:
+                return await proposal_decoder.read_proposals_page(resp)
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.parametrize('api_version', ['v1', 'v1beta1'])
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backends_parse_the_same_titles(monkeypatch, backend, api_version):
+    monkeypatch.setattr(proposal_decoder, 'BACKEND', backend)
+    network = registry.compile_networks([
+        {"name": "osmosis", "lcd_endpoints": [], "validator": VALIDATOR, "prefix": "osmo",
+         "explorer": "https://example.com/"}
+    ])['osmosis']
+    page = asyncio.run(decode(api_version, 18521))
+    assert get_data.parse_proposals_page(network, page, api_version) == EXPECTED[api_version]
+
+
+@pytest.mark.skipif(importlib.util.find_spec('ijson') is None, reason="ijson is not installed")
+@pytest.mark.parametrize('threshold, streamed', [(None, False), (2**20, False), (100, True)])
+def test_auto_streams_only_listings_above_the_threshold(monkeypatch, threshold, streamed):
+    calls = []
+    stream = proposal_decoder._stream_proposals_page
+
+    async def spy(resp):
+        calls.append(resp.content_length)
+        return await stream(resp)
+
+    monkeypatch.setattr(proposal_decoder, 'BACKEND', proposal_decoder.pick_backend('auto'))
+    monkeypatch.setattr(proposal_decoder, 'STREAM_THRESHOLD', threshold)
+    monkeypatch.setattr(proposal_decoder, '_stream_proposals_page', spy)
+    page = asyncio.run(decode('v1', 18522))
+    assert len(page['proposals']) == 5
+    assert bool(calls) == streamed
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from endpoint_health import call_endpoints
+from scheduler import FetchScheduler
+from settings import RATE_LIMIT_MAX_PAUSE
+
+
+async def serve(handler, port):
+    app = web.Application()
+    app.router.add_get('/', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+requests = []
+
+
+async def rate_limited(request):
+    requests.append(request.host)
+    return web.Response(status=429, headers={'Retry-After': '3600'})
+
+
+async def healthy(request):
+    return web.json_response({'ok': True})
+
+
+def test_long_retry_after_is_capped_and_not_waited_out():
+    async def run():
+        runner = await serve(rate_limited, 18501)
+        scheduler = FetchScheduler(4, 2)
+        try:
+            async with aiohttp.ClientSession() as session:
+                started = time.monotonic()
+                async with scheduler.get(session, 'http://127.0.0.1:18501/') as resp:
+                    status = resp.status
+                elapsed = time.monotonic() - started
+        finally:
+            await runner.cleanup()
+        paused = scheduler._paused_until['127.0.0.1:18501'] - time.monotonic()
+        return status, elapsed, paused
+
+    status, elapsed, paused = asyncio.run(run())
+    assert status == 429
+    assert requests.count('127.0.0.1:18501') == 1
+    assert elapsed < 5
+    assert 0 < paused <= RATE_LIMIT_MAX_PAUSE
+
+
+def test_long_retry_after_fails_over_to_the_next_endpoint():
+    async def run():
+        runners = [await serve(rate_limited, 18502), await serve(healthy, 18503)]
+        scheduler = FetchScheduler(4, 2)
+
+        async def attempt(endpoint):
+            async with scheduler.get(session, endpoint + '/') as resp:
+                resp.raise_for_status()
+                return endpoint
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await asyncio.wait_for(
+                    call_endpoints(['http://127.0.0.1:18502', 'http://127.0.0.1:18503'], attempt), 10
+                )
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+
+    assert asyncio.run(run()) == 'http://127.0.0.1:18503'
@@ -0,0 +1,162 @@
+"""
+Per-cycle tracing spans and on-demand profiling
+
+Every stage run (the startup cycle, a network sweep, a dispatch, ...) is a
+cycle. With TRACE_DIR set, the spans recorded while a cycle runs (sweeps,
+LCD and indexer requests, vote checks, database calls) are written to one
+JSONL file per cycle, one span per line.
+
+Sending SIGUSR1 to the bot profiles everything it does for the next
+PROFILE_WINDOW seconds with cProfile. The default window is one poll interval
+plus the sweep timeout, long enough for every network to be swept once.
+Starting the bot with BOT_PROFILE=1 in the environment opens such a window at
+startup, covering the first sweep of every network. The stats are dumped to
+PROFILE_DIR.
+"""
+
+import asyncio
+import cProfile
+import contextvars
+import itertools
+import json
+import logging
+import os
+import signal
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from settings import TRACE_DIR, TRACE_KEEP, PROFILE_DIR, PROFILE_WINDOW
+
+logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+
+_current: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('trace', default=None)
+_counter = itertools.count()
+# Profiler of the running window
+_window: Optional[cProfile.Profile] = None
+
+
+class Trace:
+    """
+    Spans of one cycle, shared by the tasks the cycle starts
+    """
+
+    def __init__(self, name: str, network: str = ''):
+        self.name = name
+        self.network = network
+        self.started = time.monotonic()
+        self.spans: List[dict] = []
+
+    def write(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        suffix = f"-{self.network}" if self.network else ''
+        path = os.path.join(
+            directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_counter)}-{self.name}{suffix}.jsonl"
+        )
+        with open(path, 'w') as f:
+            for record in self.spans:
+                f.write(json.dumps(record) + '\n')
+        prune(directory, TRACE_KEEP)
+
+
+def prune(directory: str, keep: int):
+    """Remove all but the `keep` most recent files of the directory"""
+    paths = sorted((os.path.join(directory, name) for name in os.listdir(directory)), key=os.path.getmtime)
+    for path in paths[:max(0, len(paths) - keep)]:
+        os.remove(path)
+
+
+@contextmanager
+def span(stage: str, network: str = '', endpoint: str = ''):
+    """Record how long the block took and how it ended, if a cycle is being traced"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.monotonic()
+    outcome = 'ok'
+    try:
+        yield
+    except asyncio.CancelledError:
+        outcome = 'cancelled'
+        raise
+    except Exception as e:
+        outcome = f'error: {type(e).__name__}'
+        raise
+    finally:
+        trace.spans.append({
+            'cycle': trace.name,
+            'stage': stage,
+            'network': network or trace.network,
+            'endpoint': endpoint,
+            'start': round(started - trace.started, 6),
+            'duration': round(time.monotonic() - started, 6),
+            'outcome': outcome,
+        })
+
+
+def dump_profile(profiler: cProfile.Profile, name: str):
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.prof")
+    profiler.dump_stats(path)
+    logging.info(f"Profile of {name} written to {path}")
+
+
+def _end_window():
+    global _window
+    dump_profile(_window, 'window')
+    _window = None
+
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    """An enabled profiler, None if another profiling tool is already active"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        logging.warning(f"Could not start profiling: {e}")
+        return None
+    return profiler
+
+
+def request_profile():
+    """Profile all stages for the next PROFILE_WINDOW seconds"""
+    global _window
+    if _window is not None:
+        logging.info("A profile is already being recorded, try again once it is written")
+        return
+    profiler = start_profiler()
+    if profiler is None:
+        return
+    _window = profiler
+    asyncio.get_running_loop().call_later(PROFILE_WINDOW, _end_window)
+    logging.info(f"Profiling the next {PROFILE_WINDOW}s")
+
+
+def install_signal_handler():
+    """
+    Start a profiling window on SIGUSR1, where the platform has it, and right
+    away with BOT_PROFILE=1
+    """
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, request_profile)
+    if os.environ.get('BOT_PROFILE'):
+        request_profile()
+
+
+@contextmanager
+def cycle(name: str, network: str = ''):
+    """Trace the block as one cycle"""
+    trace = Trace(name, network) if TRACE_DIR else None
+    token = _current.set(trace)
+    try:
+        with span(name, network):
+            yield
+    finally:
+        _current.reset(token)
+        if trace is not None:
+            try:
+                trace.write(TRACE_DIR)
+            except OSError as e:
+                logging.error(f"Could not write trace of {name}: {e}")
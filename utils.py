@@ -1,18 +1,25 @@
-from data.my_config import NOTIFIER_FREQUENCY, NOTIFIER_REMINDER_MODES, PHRASES, NETWORKS
+from settings import NOTIFIER_FREQUENCY, NOTIFIER_REMINDER_MODES, PHRASES
+from registry import REGISTRY
 from datetime import timedelta
+from telegram.constants import MessageLimit
+from telegram.helpers import escape_markdown
 
 import time
 import random
 
+# Longest proposal title shown in a digest, before escaping
+DIGEST_TITLE_LIMIT = 200
+
 
 def notify(row, time_left):
-    print(time_left)
     phrase = get_phrase(time_left)
-    print(phrase)
     t = timedelta(seconds=time_left)
     msg = f"Warning {t} left before voting ends"
-    network = [n for n in NETWORKS if n['name'] == row[0]][0]
-    url = f"{network['explorer']}{row[1]}"
+    network = REGISTRY[row[0]]
+    url = network.explorer_url(row[1])
+    # Say whose vote is missing when several validators share the network
+    if len(network.voters) > 1:
+        phrase = f"{phrase}\nValidator: {escape(network.validators.get(row[7], row[7]))}"
     return '\n' + "🚨" + "*" + msg + "*" + "🚨" + '\n' + phrase + '\n\n' + url
 
 
@@ -36,8 +43,63 @@ def chose_next_notification(time_left_s):
         next_notification = int(time.time()) + NOTIFIER_REMINDER_MODES["HARD"][1] + random.randint(0, 5)
     elif time_left_s in NOTIFIER_REMINDER_MODES["EXTREME"][0]:
         next_notification = int(time.time()) + NOTIFIER_REMINDER_MODES["EXTREME"][1] + random.randint(0, 5)
+    else:
+        # Voting ends later than every mode covers, check back at the slowest pace
+        next_notification = int(time.time()) + max(interval for _, interval in NOTIFIER_REMINDER_MODES.values())
     return next_notification
 
 
 def get_time_left_s(row):
-    return row[3] - int(time.time())
\ No newline at end of file
+    return row[3] - int(time.time())
+
+
+def get_tier(time_left_s):
+    for tier, (time_range, _) in NOTIFIER_REMINDER_MODES.items():
+        if time_left_s in time_range:
+            return tier
+
+
+def notify_digest(rows):
+    """
+    A single reminder for all rows, most urgent first and grouped by tier,
+    split into parts that each fit in one Telegram message
+    """
+    lines = ["🚨*Proposals waiting for a vote*🚨"]
+    tier = None
+    for row in sorted(rows, key=get_time_left_s):
+        if row[0] not in REGISTRY:
+            # Network removed from the config, its rows go once voting ends
+            continue
+        time_left = get_time_left_s(row)
+        if get_tier(time_left) != tier or len(lines) == 1:
+            tier = get_tier(time_left)
+            lines.append(f"\n*{tier or 'LATER'}*")
+        network = REGISTRY[row[0]]
+        # Fields are cut before they are escaped, so no escape is split in half
+        title = (row[2] or '')[:DIGEST_TITLE_LIMIT]
+        line = f"{escape(row[0])} #{row[1]} {escape(title)}\n{timedelta(seconds=time_left)} left"
+        if len(network.voters) > 1:
+            line += f", validator {escape(network.validators.get(row[7], row[7]))}"
+        lines.append(line + '\n' + escape(network.explorer_url(row[1])))
+    return split_message(lines)
+
+
+def escape(text) -> str:
+    return escape_markdown(str(text), version=1)
+
+
+def split_message(lines, limit=MessageLimit.MAX_TEXT_LENGTH):
+    """
+    Join lines into as few parts of at most `limit` characters as possible,
+    every line must fit in `limit` on its own
+    """
+    parts = []
+    part = ''
+    for line in lines:
+        if part and len(part) + 1 + len(line) > limit:
+            parts.append(part)
+            part = ''
+        part = f"{part}\n{line}" if part else line
+    if part:
+        parts.append(part)
+    return parts